@@ -0,0 +1,72 @@
+"""Coordinate lookups served from the in-memory cache.
+
+Times rendering the "coords po o" listing (cold after a change, then
+cached), and nearest/within queries, for 100 to 100k saved coordinates.
+
+    python benchmarks/bench_coords.py [coordinates ...]
+"""
+import asyncio
+import random
+import sys
+import time
+
+import fakes  # noqa: F401  (puts the repo on sys.path)
+
+from coords_cache import CoordinateCache
+
+SIZES = (100, 1_000, 10_000, 100_000)
+OPERATIONS = 1_000
+WORLD = 30_000  # blocks from spawn in every direction
+
+
+async def run_size(count, operations=OPERATIONS):
+    rng = random.Random(2)
+    rows = [
+        {"name": f"base{i}", "x": rng.randint(-WORLD, WORLD), "z": rng.randint(-WORLD, WORLD)}
+        for i in range(count)
+    ]
+    cache = CoordinateCache(lambda: None, None)
+    cache.index.load(rows)
+    cache.stale = False
+
+    start = time.perf_counter()
+    for _ in range(operations // 10 or 1):
+        cache._changed()
+        await cache.listing()
+    cold = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(operations):
+        await cache.listing()
+    warm = time.perf_counter() - start
+
+    points = [(rng.randint(-WORLD, WORLD), rng.randint(-WORLD, WORLD)) for _ in range(operations)]
+    start = time.perf_counter()
+    for x, z in points:
+        cache.index.nearest(x, z, 3)
+    nearest = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for x, z in points:
+        cache.index.within(x, z, 1000)
+    within = time.perf_counter() - start
+
+    return {
+        "coordinates": count,
+        "listing_cold_us": cold / (operations // 10 or 1) * 1e6,
+        "listing_cached_us": warm / operations * 1e6,
+        "nearest3_us": nearest / operations * 1e6,
+        "within1000_us": within / operations * 1e6,
+    }
+
+
+async def run(sizes=SIZES):
+    return [await run_size(count) for count in sizes]
+
+
+if __name__ == "__main__":
+    sizes = [int(arg) for arg in sys.argv[1:]] or SIZES
+    for result in asyncio.run(run(sizes)):
+        print(f"{result['coordinates']:>7} coords: listing {result['listing_cold_us']:.1f}us cold / "
+              f"{result['listing_cached_us']:.2f}us cached, nearest {result['nearest3_us']:.1f}us, "
+              f"within 1000 {result['within1000_us']:.1f}us")
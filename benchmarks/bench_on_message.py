@@ -0,0 +1,68 @@
+"""Full on_message cost with DeepSeek and Discord stubbed out.
+
+Runs messages through the real on_message: routing, tracing, history,
+payload building and the send queue, with canned LLM replies and a send
+function that does nothing. "chatter" matches no trigger, "conversation"
+goes through the LLM path for users with a live session.
+
+    python benchmarks/bench_on_message.py [iterations]
+"""
+import asyncio
+import sys
+import time
+
+from fakes import FakeAuthor, FakeMessage, stub_llm
+
+import main
+from bench_router import CHATTER
+import send_scheduler
+from conversation_store import ConversationStore
+from send_scheduler import SendScheduler
+
+USERS = 200
+
+
+async def discard(message, response):
+    pass
+
+
+async def timed(messages, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        for message in messages:
+            await main.on_message(message)
+    return (time.perf_counter() - start) / (iterations * len(messages))
+
+
+async def run(iterations=50):
+    main.bot._connection.user = FakeAuthor(0)  # on_message and process_commands compare against it
+    # measure the bot, not Discord's rate limits
+    send_scheduler.CHANNEL_RATE = send_scheduler.GLOBAL_RATE = (1e9, 1.0)
+    main.message_queue = SendScheduler(send=discard)
+    main.conversation_histories = ConversationStore(None, main.MAX_HISTORY, main.SESSION_TIMEOUT)
+    main.STREAM_REPLIES = False
+    chatter = [FakeMessage(text, user_id=USERS + i, channel_id=1) for i, text in enumerate(CHATTER)]
+    results = {"chatter_us": await timed(chatter, iterations * 10) * 1e6}
+
+    with stub_llm():
+        openers = [FakeMessage("woi kodok halo", user_id=user_id, channel_id=2) for user_id in range(USERS)]
+        for message in openers:
+            await main.on_message(message)
+        replies = [FakeMessage("iya bro bener banget", user_id=user_id, channel_id=2) for user_id in range(USERS)]
+        results["conversation_us"] = await timed(replies, iterations) * 1e6
+
+        main.STREAM_REPLIES = True
+        results["conversation_streamed_us"] = await timed(replies, iterations) * 1e6
+
+        # let the background history folds finish while the LLM is still stubbed
+        current = asyncio.current_task()
+        await asyncio.gather(*(task for task in asyncio.all_tasks()
+                               if task is not current and task.get_coro().__name__ == "fold_history"))
+
+    return results
+
+
+if __name__ == "__main__":
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    for label, value in asyncio.run(run(iterations)).items():
+        print(f"{label:>25}: {value:.2f}us per message")
@@ -0,0 +1,79 @@
+"""Stalk feature cost on guilds of 100 to 100k members.
+
+Times building the presence index, applying one presence update, picking
+a member with get_random_user_with_activity and describing them, next to
+a plain scan over every member (what picking used to cost).
+
+    python benchmarks/bench_presence.py [members ...]
+"""
+import asyncio
+import contextlib
+import os
+import random
+import sys
+import time
+
+import discord
+
+from fakes import make_guild
+
+import main
+from presence import PresenceIndex, member_activities
+
+SIZES = (100, 1_000, 10_000, 100_000)
+OPERATIONS = 2_000
+
+
+async def run_size(members, operations=OPERATIONS):
+    guild = make_guild(members)
+    index = main.presence_index = PresenceIndex()
+
+    start = time.perf_counter()
+    index.load(guild)
+    load = time.perf_counter() - start
+
+    start = time.perf_counter()
+    eligible = [member for member in guild.members if member_activities(member)]
+    scan = time.perf_counter() - start
+
+    rng = random.Random(1)
+    changed = [rng.choice(guild.members) for _ in range(operations)]
+    start = time.perf_counter()
+    for member in changed:
+        member.activities = (discord.Game(name="Minecraft"),) if not member.activities else ()
+        await main.on_presence_update(member, member)
+    update = time.perf_counter() - start
+
+    picked = []
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        start = time.perf_counter()
+        for _ in range(operations):
+            picked.append(await main.get_random_user_with_activity(guild))
+        pick = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for member in picked:
+        main.describe_activity(member)
+    describe = time.perf_counter() - start
+
+    return {
+        "members": members,
+        "eligible": len(eligible),
+        "index_load_ms": load * 1e3,
+        "full_scan_ms": scan * 1e3,
+        "presence_update_us": update / operations * 1e6,
+        "pick_us": pick / operations * 1e6,
+        "describe_us": describe / operations * 1e6,
+    }
+
+
+async def run(sizes=SIZES):
+    return [await run_size(members) for members in sizes]
+
+
+if __name__ == "__main__":
+    sizes = [int(arg) for arg in sys.argv[1:]] or SIZES
+    for result in asyncio.run(run(sizes)):
+        print(f"{result['members']:>7} members: pick {result['pick_us']:.2f}us "
+              f"(full scan {result['full_scan_ms']:.2f}ms), update {result['presence_update_us']:.2f}us, "
+              f"describe {result['describe_us']:.2f}us, index load {result['index_load_ms']:.2f}ms")
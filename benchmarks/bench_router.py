@@ -0,0 +1,101 @@
+"""Per-message cost of on_message trigger matching.
+
+Compares the router against the old if-chain (lowercase + re.match per
+trigger) on a busy-channel mix where most messages match nothing, and
+checks both pick the same trigger for every message.
+
+    python benchmarks/bench_router.py [iterations]
+"""
+import asyncio
+import re
+import sys
+import time
+
+from fakes import FakeMessage
+
+import main
+
+
+CHATTER = [
+    "lol",
+    "gg wp",
+    "anyone up for valorant tonight?",
+    "bro the creeper blew up my whole base 💀",
+    "ok",
+    "nah i think the nether update was better honestly, the bastions are so much fun to raid with friends",
+    "wkwkwkwk",
+    "what time is it over there",
+]
+TRIGGERS = [
+    "okay shut up kodok",
+    "woi kodok how are you",
+    "add base 100 -200 dong",
+    "delete base pls",
+    "coords po o",
+    "i pick rock",
+    "affakah saya cocok dengan budi",
+    "what do you think of budi and ani",
+    "hey metal kodok",
+]
+
+
+async def legacy_match(message):
+    """The pre-router if-chain, minus the handlers"""
+    history_key = await main.get_history_key(message)
+    if message.content.lower() == "okay shut up kodok":
+        return "shut_up"
+    if message.content.lower().startswith("woi kodok"):
+        return "woi_kodok"
+    if await main.conversation_histories.load(history_key) is not None:
+        return "conversation"
+    if re.match(r"add (\w+) (-?\d+) (-?\d+) dong", message.content.lower()):
+        return "add_coordinate"
+    if re.match(r"delete (\w+) pls", message.content.lower()):
+        return "delete_coordinate"
+    if re.match(r"coords po o", message.content.lower()):
+        return "list_coordinates"
+    if re.match(r"i pick (rock|paper|scissors)", message.content.lower()):
+        return "rock_paper_scissors"
+    if re.match(r"affakah saya cocok dengan (.+)", message.content.lower()):
+        return "compatibility"
+    if re.match(r"what do you think of (.+) and (.+)", message.content.lower()):
+        return "what_do_you_think"
+    if any(name in message.content.lower() for name in main.special_names):
+        return "special_names"
+    if "metal kodok" in message.content.lower():
+        return "metal_kodok"
+    return None
+
+
+async def router_match(message):
+    trigger, _ = await main.message_router.match(message)
+    return trigger.name if trigger else None
+
+
+async def timed(match, messages, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        for message in messages:
+            await match(message)
+    return (time.perf_counter() - start) / (iterations * len(messages))
+
+
+async def run(iterations):
+    messages = [FakeMessage(text) for text in CHATTER + TRIGGERS]
+    for message in messages:
+        assert await legacy_match(message) == await router_match(message), message.content
+
+    results = {}
+    for label, sample in (("no_match", [FakeMessage(text) for text in CHATTER]),
+                          ("mixed", messages)):
+        results[label] = {
+            "legacy_us": await timed(legacy_match, sample, iterations) * 1e6,
+            "router_us": await timed(router_match, sample, iterations) * 1e6,
+        }
+    return results
+
+
+if __name__ == "__main__":
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    for label, result in asyncio.run(run(iterations)).items():
+        print(f"{label:>9}: legacy {result['legacy_us']:.2f}us  router {result['router_us']:.2f}us per message")
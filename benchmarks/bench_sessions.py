@@ -0,0 +1,67 @@
+"""Conversation history cost as the number of live sessions grows.
+
+Times add_to_history on existing sessions, a clear_expired_sessions sweep
+when nothing is due, and expiring every session at once, for stores
+holding 10k to 1M sessions (no database, so nothing is flushed).
+
+    python benchmarks/bench_sessions.py [sessions ...]
+"""
+import asyncio
+import random
+import sys
+import time
+
+import fakes  # noqa: F401  (puts the repo on sys.path)
+
+import main
+from conversation_store import ConversationStore
+
+SIZES = (10_000, 100_000, 1_000_000)
+OPERATIONS = 10_000
+
+
+async def run_size(sessions, operations=OPERATIONS):
+    store = ConversationStore(None, main.MAX_HISTORY, main.SESSION_TIMEOUT, max_sessions=sessions)
+    main.conversation_histories = store
+    keys = [(user_id, 1) for user_id in range(sessions)]
+
+    start = time.perf_counter()
+    for key in keys:
+        store.append(key, "user", "halo kodok")
+    populate = time.perf_counter() - start
+
+    rng = random.Random(0)
+    sample = [rng.choice(keys) for _ in range(operations)]
+    start = time.perf_counter()
+    for key in sample:
+        await main.add_to_history(key, "assistant", "apa bro")
+    add = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(operations):
+        await main.clear_expired_sessions()
+    sweep = time.perf_counter() - start
+
+    start = time.perf_counter()
+    expired = store.expire(now=time.monotonic() + main.SESSION_TIMEOUT + 1)
+    expire_all = time.perf_counter() - start
+    assert len(expired) == sessions and len(store) == 0
+
+    return {
+        "sessions": sessions,
+        "populate_us_per_session": populate / sessions * 1e6,
+        "add_to_history_us": add / operations * 1e6,
+        "idle_sweep_us": sweep / operations * 1e6,
+        "expire_us_per_session": expire_all / sessions * 1e6,
+    }
+
+
+async def run(sizes=SIZES):
+    return [await run_size(sessions) for sessions in sizes]
+
+
+if __name__ == "__main__":
+    sizes = [int(arg) for arg in sys.argv[1:]] or SIZES
+    for result in asyncio.run(run(sizes)):
+        print(f"{result['sessions']:>9} sessions: add_to_history {result['add_to_history_us']:.2f}us, "
+              f"idle sweep {result['idle_sweep_us']:.2f}us, expire {result['expire_us_per_session']:.2f}us/session")
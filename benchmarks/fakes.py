@@ -0,0 +1,122 @@
+"""Stand-ins for Discord objects and DeepSeek, so benchmarks run offline."""
+import contextlib
+import os
+import random
+import sys
+
+import discord
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import llm  # noqa: E402
+
+
+class FakeAuthor:
+    def __init__(self, user_id):
+        self.id = user_id
+        self.bot = False
+
+
+class FakeChannel:
+    def __init__(self, channel_id, name="general"):
+        self.id = channel_id
+        self.name = name
+
+    @contextlib.asynccontextmanager
+    async def typing(self):
+        yield
+
+    async def send(self, content, **kwargs):
+        return FakeMessage(content, 0, self.id)
+
+
+class FakeMessage:
+    _state = None  # enough for commands.Bot.get_context on non-command messages
+
+    def __init__(self, content, user_id=1, channel_id=1):
+        self.content = content
+        self.author = FakeAuthor(user_id)
+        self.channel = FakeChannel(channel_id)
+        self.guild = None
+
+    async def reply(self, content, **kwargs):
+        return FakeMessage(content, 0, self.channel.id)
+
+    async def edit(self, content=None, **kwargs):
+        self.content = content
+
+
+class FakeMember:
+    def __init__(self, guild, member_id, activities=(), status=discord.Status.online, bot=False):
+        self.guild = guild
+        self.id = member_id
+        self.activities = tuple(activities)
+        self.status = status
+        self.bot = bot
+        self.display_name = f"member{member_id}"
+        self.mention = f"<@{member_id}>"
+
+
+class FakeGuild:
+    def __init__(self, guild_id=1, name="bench"):
+        self.id = guild_id
+        self.name = name
+        self._members = {}
+
+    @property
+    def members(self):
+        return list(self._members.values())
+
+    def get_member(self, member_id):
+        return self._members.get(member_id)
+
+    def add(self, member):
+        self._members[member.id] = member
+
+
+def random_activities(rng):
+    """A presence mix roughly like a real server: mostly idle or custom status"""
+    roll = rng.random()
+    if roll < 0.4:
+        return []
+    if roll < 0.6:
+        return [discord.CustomActivity(name="vibing")]
+    if roll < 0.75:
+        return [discord.Game(name=rng.choice(["Minecraft", "Valorant", "osu!"]))]
+    if roll < 0.85:
+        return [discord.Activity(type=discord.ActivityType.listening, name="lofi radio")]
+    if roll < 0.95:
+        return [discord.Activity(type=discord.ActivityType.watching, name="YouTube")]
+    return [discord.CustomActivity(name="afk"), discord.Game(name="Terraria")]
+
+
+def make_guild(size, seed=0):
+    rng = random.Random(seed)
+    guild = FakeGuild()
+    for member_id in range(1, size + 1):
+        status = discord.Status.offline if rng.random() < 0.5 else discord.Status.online
+        guild.add(FakeMember(guild, member_id, random_activities(rng), status, bot=rng.random() < 0.02))
+    return guild
+
+
+REPLY = "wkwk iya bro, santai aja 🐸"
+
+
+async def fake_chat(messages, timeout=None, **kwargs):
+    return REPLY
+
+
+async def fake_stream_chat(messages, timeout=None, **kwargs):
+    for word in REPLY.split(" "):
+        yield word + " "
+
+
+@contextlib.contextmanager
+def stub_llm():
+    """Swap DeepSeek for canned replies while benchmarking"""
+    chat, stream_chat = llm.chat, llm.stream_chat
+    llm.chat, llm.stream_chat = fake_chat, fake_stream_chat
+    try:
+        yield
+    finally:
+        llm.chat, llm.stream_chat = chat, stream_chat
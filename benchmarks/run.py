@@ -0,0 +1,123 @@
+"""Run every benchmark offline and write the numbers as JSON.
+
+    python benchmarks/run.py                  # full sizes (1M sessions, 100k members)
+    python benchmarks/run.py --quick          # smaller sizes, a few seconds
+    python benchmarks/run.py --compare old.json
+
+Results go to benchmarks/results/<commit>.json unless --out is given.
+With --compare, every timing is printed next to the old run's, so a
+regression between two commits stands out. All timings are
+lower-is-better.
+"""
+import argparse
+import asyncio
+import contextlib
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+
+import fakes  # noqa: F401  (puts the repo on sys.path)
+
+import bench_coords
+import bench_on_message
+import bench_presence
+import bench_router
+import bench_sessions
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+QUICK = {
+    "router": 500,
+    "on_message": 10,
+    "sessions": (10_000, 100_000),
+    "presence": (100, 1_000, 10_000),
+    "coords": (100, 1_000, 10_000),
+}
+FULL = {
+    "router": 2_000,
+    "on_message": 50,
+    "sessions": bench_sessions.SIZES,
+    "presence": bench_presence.SIZES,
+    "coords": bench_coords.SIZES,
+}
+
+
+def commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=HERE, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+async def run(sizes):
+    # the bot prints while it works; keep that out of the report
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        return {
+            "router": await bench_router.run(sizes["router"]),
+            "on_message": await bench_on_message.run(sizes["on_message"]),
+            "sessions": await bench_sessions.run(sizes["sessions"]),
+            "presence": await bench_presence.run(sizes["presence"]),
+            "coords": await bench_coords.run(sizes["coords"]),
+        }
+
+
+def flatten(value, prefix=""):
+    """{"a": [{"n": 1, "x_us": 2}]} -> {"a.n=1.x_us": 2}; size fields become part of the key"""
+    if isinstance(value, dict):
+        items = {}
+        for key, inner in value.items():
+            items.update(flatten(inner, f"{prefix}{key}."))
+        return items
+    if isinstance(value, list):
+        items = {}
+        for entry in value:
+            size_key, size = next(iter(entry.items()))
+            items.update(flatten({k: v for k, v in entry.items() if k != size_key}, f"{prefix}{size_key}={size}."))
+        return items
+    return {prefix.rstrip("."): value}
+
+
+def compare(old, new):
+    old_values = flatten(old["results"])
+    print(f"{'benchmark':<55}{old['commit']:>12}{new['commit']:>12}   change")
+    for key, value in flatten(new["results"]).items():
+        before = old_values.get(key)
+        if not isinstance(value, float) or not before:
+            continue
+        change = (value - before) / before * 100
+        flag = "  <-- slower" if change > 10 else ""
+        print(f"{key:<55}{before:>12.2f}{value:>12.2f}   {change:+.0f}%{flag}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--quick", action="store_true", help="smaller sizes")
+    parser.add_argument("--out", help="where to write the JSON results")
+    parser.add_argument("--compare", help="earlier results JSON to compare against")
+    args = parser.parse_args()
+
+    report = {
+        "commit": commit(),
+        "date": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "quick": args.quick,
+        "results": asyncio.run(run(QUICK if args.quick else FULL)),
+    }
+
+    out = args.out or os.path.join(HERE, "results", f"{report['commit']}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w", encoding="utf-8") as file:
+        json.dump(report, file, indent=2)
+    print(f"Wrote {out}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as file:
+            compare(json.load(file), report)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,185 @@
+"""Run the bot as several sharded processes on one host.
+
+`python cluster.py` asks Discord how many shards the bot should use (or
+takes SHARD_COUNT), splits them into CLUSTER_PROCESSES contiguous ranges
+and starts one main.py per range with SHARD_IDS / SHARD_COUNT / CLUSTER_ID
+set. Each worker is an AutoShardedBot that only connects its own shards,
+so adding guilds spreads gateway and LLM work over more cores instead of
+queueing everything on one event loop. Crashed workers are restarted.
+
+Cron jobs must still fire once per cluster, not once per process.
+LeaderElection holds a Postgres session-level advisory lock on its own
+connection; whichever worker holds it is the leader, and jobs wrapped
+with LeaderElection.only() skip everywhere else. If the leader dies its connection
+drops, Postgres releases the lock and another worker takes over within
+LEADER_RETRY seconds. The leader checks its lock connection every
+LEADER_HEARTBEAT seconds with a LEADER_TIMEOUT bound, and steps down as
+soon as a check fails, so a half-open connection can't leave it leading
+while another worker already holds the lock.
+
+Started directly as `python main.py` with no SHARD_IDS, the bot is a
+single process that is always its own leader.
+"""
+import asyncio
+import functools
+import os
+import signal
+import sys
+
+import aiohttp
+import asyncpg
+
+
+SHARD_IDS = os.getenv("SHARD_IDS")  # "0,1,2" or "0-2"; unset runs every shard
+SHARD_COUNT = int(os.getenv("SHARD_COUNT", "0")) or None
+CLUSTER_ID = int(os.getenv("CLUSTER_ID", "0"))
+CLUSTER_PROCESSES = int(os.getenv("CLUSTER_PROCESSES", str(os.cpu_count() or 1)))
+CLUSTERED = SHARD_IDS is not None
+
+LEADER_LOCK_KEY = 0x6B6F646F6B  # "kodok"; any bigint that nothing else locks
+LEADER_RETRY = 15  # seconds between attempts to take the lock
+LEADER_HEARTBEAT = 5  # seconds between liveness checks while leading
+LEADER_TIMEOUT = 5  # seconds a connect or query on the lock connection may take
+# heartbeat + timeout must stay under LEADER_RETRY: the old leader has to give up before a new one can win
+RESTART_DELAY = 5  # seconds before restarting a crashed worker
+
+MAIN = os.path.join(os.path.dirname(os.path.abspath(__file__)), "main.py")
+
+
+def parse_shard_ids(value):
+    """'0,1,5' or '0-3' or a mix of both -> sorted list of ints"""
+    shard_ids = set()
+    for part in value.split(","):
+        part = part.strip()
+        if "-" in part:
+            first, last = part.split("-")
+            shard_ids.update(range(int(first), int(last) + 1))
+        elif part:
+            shard_ids.add(int(part))
+    return sorted(shard_ids)
+
+
+def bot_options():
+    """commands.AutoShardedBot kwargs for this worker's slice of the shards"""
+    options = {}
+    if SHARD_COUNT:
+        options["shard_count"] = SHARD_COUNT
+    if CLUSTERED:
+        options["shard_ids"] = parse_shard_ids(SHARD_IDS)
+    return options
+
+
+class LeaderElection:
+    """Leader = holder of a Postgres advisory lock on a dedicated connection"""
+
+    def __init__(self, dsn, key=LEADER_LOCK_KEY, clustered=CLUSTERED):
+        self.dsn = dsn
+        self.key = key
+        self.clustered = clustered
+        self.is_leader = not clustered  # a lone process leads itself
+
+    async def run(self):
+        if not self.clustered:
+            return
+        delay = 1
+        while True:
+            conn = None
+            try:
+                conn = await asyncpg.connect(self.dsn, timeout=LEADER_TIMEOUT)
+                lost = asyncio.Event()
+                conn.add_termination_listener(lambda _: lost.set())
+                while not await conn.fetchval("SELECT pg_try_advisory_lock($1)", self.key, timeout=LEADER_TIMEOUT):
+                    await asyncio.sleep(LEADER_RETRY)
+                self.is_leader = True
+                delay = 1
+                print(f"👑 Cluster {CLUSTER_ID} is now the scheduler leader")
+                while not lost.is_set():
+                    try:
+                        await asyncio.wait_for(lost.wait(), LEADER_HEARTBEAT)
+                    except asyncio.TimeoutError:
+                        # a dead or half-open connection raises here and drops leadership below
+                        await conn.execute("SELECT 1", timeout=LEADER_TIMEOUT)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Leader election error: {e!r}")
+            finally:
+                if self.is_leader:
+                    print(f"👑 Cluster {CLUSTER_ID} lost scheduler leadership")
+                self.is_leader = False
+                if conn is not None and not conn.is_closed():
+                    conn.terminate()
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 60)
+
+    def only(self, job):
+        """Wrap a scheduled job so it only runs on the leader"""
+        @functools.wraps(job)
+        async def leader_job(*args, **kwargs):
+            if not self.is_leader:
+                return
+            return await job(*args, **kwargs)
+        return leader_job
+
+
+async def recommended_shards(token):
+    async with aiohttp.ClientSession() as session:
+        async with session.get(
+            "https://discord.com/api/v10/gateway/bot",
+            headers={"Authorization": f"Bot {token}"},
+        ) as response:
+            response.raise_for_status()
+            return (await response.json())["shards"]
+
+
+def shard_ranges(shard_count, processes):
+    """Split 0..shard_count-1 into at most `processes` contiguous ranges"""
+    processes = max(1, min(processes, shard_count))
+    size, extra = divmod(shard_count, processes)
+    ranges, start = [], 0
+    for i in range(processes):
+        end = start + size + (1 if i < extra else 0)
+        ranges.append(range(start, end))
+        start = end
+    return ranges
+
+
+async def supervise(cluster_id, shard_ids, shard_count, children, stopping):
+    env = dict(os.environ, CLUSTER_ID=str(cluster_id), SHARD_COUNT=str(shard_count),
+               SHARD_IDS=f"{shard_ids.start}-{shard_ids.stop - 1}")
+    while True:
+        print(f"🚀 Starting cluster {cluster_id} with shards {shard_ids.start}-{shard_ids.stop - 1}")
+        process = await asyncio.create_subprocess_exec(sys.executable, MAIN, env=env)
+        children[cluster_id] = process
+        code = await process.wait()
+        if stopping.is_set():
+            return
+        print(f"💥 Cluster {cluster_id} exited with {code}, restarting in {RESTART_DELAY}s")
+        await asyncio.sleep(RESTART_DELAY)
+
+
+async def launch():
+    shard_count = SHARD_COUNT or await recommended_shards(os.getenv("DISCORD_TOKEN"))
+    ranges = shard_ranges(shard_count, CLUSTER_PROCESSES)
+    print(f"Launching {len(ranges)} clusters for {shard_count} shards")
+
+    children = {}
+    stopping = asyncio.Event()
+
+    def stop():
+        stopping.set()
+        for child in children.values():
+            if child.returncode is None:
+                child.terminate()
+
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop)
+    await asyncio.gather(*(
+        supervise(cluster_id, shard_ids, shard_count, children, stopping)
+        for cluster_id, shard_ids in enumerate(ranges)
+    ))
+
+
+if __name__ == "__main__":
+    asyncio.run(launch())
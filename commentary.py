@@ -0,0 +1,92 @@
+"""Activity commentary prepared ahead of the scheduled stalk posts.
+
+random_activity_commentary and daily_stalk used to pick a member when
+the cron fired and then wait on one DeepSeek call per post; if DeepSeek
+was slow or down, the slot got a canned line. Now a prepare job runs
+COMMENTARY_LEAD minutes before each slot, samples a few candidates and
+asks for all their commentaries in one batched request. The results wait
+in a CommentaryBuffer until the slot fires, which then posts one for a
+member who is still doing what it's about.
+
+A failed or unparseable batch just leaves the slot empty; the job then
+falls back to generating commentary live, as before.
+"""
+import json
+import os
+import random
+import time
+
+import llm
+
+
+COMMENTARY_LEAD = min(59, max(1, int(os.getenv("COMMENTARY_LEAD", "5"))))  # minutes before a slot to prepare it
+COMMENTARY_CANDIDATES = int(os.getenv("COMMENTARY_CANDIDATES", "4"))  # members sampled per slot
+COMMENTARY_TTL = COMMENTARY_LEAD * 60 + 300  # prepared commentary expires 5 minutes after its slot
+
+BATCH_PROMPT = """Generate a short, witty, sarcastic commentary for each of these Discord users about what they're doing, in Indonesian mixed with English. Keep each under 2 sentences and make it funny. Don't mention their names.
+
+{activities}
+
+Reply with only a JSON object mapping each number to its commentary, like {{"1": "...", "2": "..."}}."""
+
+
+def batch_prompt(descriptions):
+    return BATCH_PROMPT.format(activities="\n".join(
+        f"{number}. A user is {description}." for number, description in enumerate(descriptions, 1)
+    ))
+
+
+def parse_batch(content, count):
+    """Commentary per description from the model's JSON reply; None where one is missing"""
+    content = content.strip()
+    if content.startswith("```"):
+        content = content.strip("`").removeprefix("json").strip()
+    try:
+        parsed = json.loads(content)
+    except ValueError:
+        return [None] * count
+    if isinstance(parsed, list):
+        parsed = {str(number): text for number, text in enumerate(parsed, 1)}
+    if not isinstance(parsed, dict):
+        return [None] * count
+    texts = [parsed.get(str(number)) for number in range(1, count + 1)]
+    return [text.strip() if isinstance(text, str) and text.strip() else None for text in texts]
+
+
+async def generate_batch(personality, descriptions):
+    """One LLM call for a whole slot's candidates"""
+    content = await llm.chat(
+        [
+            {"role": "system", "content": personality},
+            {"role": "user", "content": batch_prompt(descriptions)},
+        ],
+        response_format={"type": "json_object"},
+    )
+    return parse_batch(content, len(descriptions))
+
+
+class CommentaryBuffer:
+    """slot name -> (guild id, [(member id, activity description, commentary)]), short-lived"""
+
+    def __init__(self, ttl=COMMENTARY_TTL):
+        self.ttl = ttl
+        self._slots = {}  # slot -> (expires_at, guild id, entries)
+        self.prepared = 0
+        self.used = 0
+        self.stale = 0
+
+    def put(self, slot, guild_id, entries):
+        self._slots[slot] = (time.monotonic() + self.ttl, guild_id, list(entries))
+        self.prepared += 1
+
+    def take(self, slot):
+        """The slot's prepared guild id and entries (shuffled), or None; a slot is only taken once"""
+        prepared = self._slots.pop(slot, None)
+        if prepared is None:
+            return None
+        expires_at, guild_id, entries = prepared
+        if expires_at <= time.monotonic() or not entries:
+            self.stale += 1
+            return None
+        random.shuffle(entries)
+        return guild_id, entries
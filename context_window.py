@@ -0,0 +1,41 @@
+"""Token accounting for the conversation history sent to DeepSeek."""
+import os
+import re
+
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1500"))  # history tokens per request
+MESSAGE_OVERHEAD = 4  # role/separator tokens the API adds per message
+CHARS_PER_TOKEN = 4
+
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+
+
+def estimate_tokens(text):
+    """Local token estimate: ~4 characters per token for words, one per symbol"""
+    count = MESSAGE_OVERHEAD
+    for piece in _TOKEN_RE.findall(text):
+        count += (len(piece) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+    return count
+
+
+def overflow_count(turns, budget, reserved=0):
+    """How many of the oldest (role, content, tokens) turns don't fit in the budget.
+
+    The newest turn is always kept, even if it alone is over budget.
+    """
+    used = reserved
+    keep = 0
+    for turn in reversed(turns):
+        used += turn[2]
+        if used > budget and keep:
+            break
+        keep += 1
+    return len(turns) - keep
+
+
+def clip_to_budget(content, budget):
+    """Cut a single oversized message down to roughly budget tokens"""
+    limit = budget * CHARS_PER_TOKEN
+    if len(content) <= limit:
+        return content
+    return content[:limit] + " …"
@@ -0,0 +1,327 @@
+"""Conversation histories: LRU-bounded in memory, written behind to Postgres.
+
+The hot tier keeps at most HISTORY_MAX_SESSIONS sessions. Changed sessions
+are collected and upserted in one batched statement every
+HISTORY_FLUSH_INTERVAL seconds, so a restart only loses the last few
+seconds of chatter and the database never sees one write per message.
+
+Sessions carry a monotonic last-seen time and sit in an expiry heap with
+one entry per session, so a sweep only pops keys whose deadline passed.
+"""
+import asyncio
+import contextlib
+import heapq
+import json
+import os
+import time
+from collections import OrderedDict, deque
+from datetime import datetime, timezone
+
+from context_window import estimate_tokens
+
+
+HISTORY_MAX_SESSIONS = int(os.getenv("HISTORY_MAX_SESSIONS", "5000"))
+HISTORY_FLUSH_INTERVAL = float(os.getenv("HISTORY_FLUSH_INTERVAL", "5"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS conversation_sessions (
+    user_id BIGINT NOT NULL,
+    channel_id BIGINT NOT NULL,
+    messages JSONB NOT NULL,
+    updated_at TIMESTAMPTZ NOT NULL,
+    PRIMARY KEY (user_id, channel_id)
+)
+"""
+
+UPSERT_SESSIONS = """
+INSERT INTO conversation_sessions (user_id, channel_id, messages, updated_at)
+SELECT u, c, m::jsonb, t
+FROM unnest($1::bigint[], $2::bigint[], $3::text[], $4::timestamptz[]) AS s(u, c, m, t)
+ON CONFLICT (user_id, channel_id)
+DO UPDATE SET messages = EXCLUDED.messages, updated_at = EXCLUDED.updated_at
+"""
+
+DELETE_SESSIONS = """
+DELETE FROM conversation_sessions
+WHERE (user_id, channel_id) IN (SELECT * FROM unnest($1::bigint[], $2::bigint[]))
+"""
+
+
+class Session:
+    """Recent turns of one conversation plus a running summary of older ones"""
+    __slots__ = ("turns", "last_seen", "summary", "folding")
+
+    def __init__(self, capacity, turns=(), last_seen=None, summary=""):
+        self.turns = deque(turns, maxlen=capacity)  # (role, content, tokens)
+        self.last_seen = time.monotonic() if last_seen is None else last_seen
+        self.summary = summary
+        self.folding = False
+
+    def __len__(self):
+        return len(self.turns)
+
+    @property
+    def full(self):
+        return len(self.turns) >= self.turns.maxlen
+
+    def add(self, role, content, now=None):
+        self.turns.append((role, content, estimate_tokens(content)))
+        self.last_seen = time.monotonic() if now is None else now
+
+    def messages(self):
+        """Turns in chat-completions format"""
+        return [{"role": role, "content": content} for role, content, _ in self.turns]
+
+    def to_json(self):
+        messages = self.messages()
+        if self.summary:
+            messages.insert(0, {"role": "summary", "content": self.summary})
+        return json.dumps(messages)
+
+    def wall_time(self):
+        """last_seen as a wall-clock datetime, for storage"""
+        return datetime.fromtimestamp(time.time() - (time.monotonic() - self.last_seen), timezone.utc)
+
+    @classmethod
+    def from_row(cls, capacity, messages, updated_at):
+        messages = json.loads(messages)
+        summary = ""
+        if messages and messages[0]["role"] == "summary":
+            summary = messages.pop(0)["content"]
+        turns = [(msg["role"], msg["content"], estimate_tokens(msg["content"])) for msg in messages]
+        last_seen = time.monotonic() - max(0.0, time.time() - updated_at.timestamp())
+        return cls(capacity, turns, last_seen, summary)
+
+
+class ConversationStore:
+    """Conversation sessions keyed by (user_id, channel_id)"""
+
+    def __init__(self, database, max_history, timeout, max_sessions=HISTORY_MAX_SESSIONS):
+        self._database = database  # db.Database, or None to keep sessions in memory only
+        self.max_history = max_history
+        self.timeout = timeout
+        self.max_sessions = max_sessions
+        self._sessions = OrderedDict()
+        self._locks = {}  # key -> [lock, holders and waiters]
+        self._dirty = set()
+        self._deleted = set()
+        self._restored = set()  # restored at startup and not used by this process since
+        self._pending = {}  # evicted before being flushed: key -> Session
+        self._evicted = {}  # evicted and flushed: key -> last_seen
+        self._expiry = []  # heap of (deadline, key), one entry per key
+        self._scheduled = set()
+
+    def __contains__(self, key):
+        return key in self._sessions or key in self._pending or key in self._evicted
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def __getitem__(self, key):
+        return self._sessions[key]
+
+    def get(self, key, default=None):
+        return self._sessions.get(key, default)
+
+    def __delitem__(self, key):
+        self._remove(key, delete=True)
+
+    def _remove(self, key, delete):
+        found = (self._sessions.pop(key, None), self._pending.pop(key, None), self._evicted.pop(key, None))
+        if found == (None, None, None):
+            raise KeyError(key)
+        self._dirty.discard(key)
+        self._restored.discard(key)
+        if delete and self._database is not None:
+            self._deleted.add(key)
+
+    @contextlib.asynccontextmanager
+    async def lock(self, key):
+        """Per-session lock; its entry only lives while someone holds or waits for it"""
+        entry = self._locks.get(key)
+        if entry is None:
+            entry = self._locks[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._locks[key]
+
+    def _schedule(self, key, last_seen):
+        if key not in self._scheduled:
+            self._scheduled.add(key)
+            heapq.heappush(self._expiry, (last_seen + self.timeout, key))
+
+    def append(self, key, role, content):
+        """Add one turn to a session; the oldest turn falls off past max_history"""
+        session = self._sessions.get(key)
+        if session is None:
+            session = self._sessions[key] = Session(self.max_history)
+        else:
+            self._sessions.move_to_end(key)
+        session.add(role, content)
+        self._schedule(key, session.last_seen)
+        self._dirty.add(key)
+        self._deleted.discard(key)
+        self._restored.discard(key)
+        self._evict()
+        return session
+
+    def mark_dirty(self, key):
+        """Queue a session for the next flush after changing it in place"""
+        if key in self._sessions:
+            self._dirty.add(key)
+            self._restored.discard(key)
+
+    def _evict(self):
+        while len(self._sessions) > self.max_sessions:
+            key, session = self._sessions.popitem(last=False)
+            if key in self._dirty:
+                self._dirty.discard(key)
+                if self._database is None:
+                    continue  # nowhere to write it, so it can't come back either
+                self._pending[key] = session
+            else:
+                self._evicted[key] = session.last_seen
+
+    def _last_seen(self, key):
+        session = self._sessions.get(key) or self._pending.get(key)
+        if session is not None:
+            return session.last_seen
+        return self._evicted.get(key)
+
+    def is_expired(self, session, now=None):
+        now = time.monotonic() if now is None else now
+        return now - session.last_seen > self.timeout
+
+    def expire(self, now=None):
+        """Drop sessions idle for longer than the timeout; returns the expired keys"""
+        now = time.monotonic() if now is None else now
+        expired = []
+        while self._expiry and self._expiry[0][0] <= now:
+            _, key = heapq.heappop(self._expiry)
+            self._scheduled.discard(key)
+            last_seen = self._last_seen(key)
+            if last_seen is None:
+                continue  # deleted since it was scheduled
+            if last_seen + self.timeout > now:
+                self._schedule(key, last_seen)  # touched since, check again later
+                continue
+            # every clustered worker restores every session; only the one that used it may delete its row
+            self._remove(key, delete=key not in self._restored)
+            expired.append(key)
+        return expired
+
+    async def load(self, key):
+        """Return a session, reading evicted sessions back from Postgres"""
+        session = self._sessions.get(key)
+        if session is not None:
+            self._sessions.move_to_end(key)
+            return session
+
+        session = self._pending.pop(key, None)
+        if session is None and self._evicted.pop(key, None) is not None:
+            session = await self._fetch(key)
+            if session is None:
+                return None
+            self._sessions[key] = session
+            self._evict()
+            return session
+        if session is not None:
+            self._sessions[key] = session
+            self._dirty.add(key)
+            self._evict()
+        return session
+
+    async def _fetch(self, key):
+        if self._database is None:
+            return None
+        try:
+            async with self._database.acquire() as conn:
+                row = await conn.fetchrow(
+                    "SELECT messages, updated_at FROM conversation_sessions WHERE user_id = $1 AND channel_id = $2",
+                    *key
+                )
+        except Exception as e:
+            print(f"Conversation load error: {e}")
+            return None
+        if row is None:
+            return None
+        return Session.from_row(self.max_history, row["messages"], row["updated_at"])
+
+    async def restore(self):
+        """Load sessions that were still active when the bot last stopped"""
+        if self._database is None:
+            return
+        try:
+            async with self._database.acquire() as conn:
+                await conn.execute(SCHEMA)
+                await conn.execute(
+                    "DELETE FROM conversation_sessions WHERE updated_at < now() - make_interval(secs => $1)",
+                    float(self.timeout)
+                )
+                rows = await conn.fetch(
+                    "SELECT user_id, channel_id, messages, updated_at FROM conversation_sessions "
+                    "ORDER BY updated_at DESC LIMIT $1",
+                    self.max_sessions
+                )
+        except Exception as e:
+            print(f"Conversation restore error: {e}")
+            return
+        for row in reversed(rows):
+            key = (row["user_id"], row["channel_id"])
+            if key not in self._sessions and key not in self._deleted:  # not if deleted but not yet flushed
+                session = Session.from_row(self.max_history, row["messages"], row["updated_at"])
+                self._sessions[key] = session
+                self._restored.add(key)
+                self._schedule(key, session.last_seen)
+        print(f"♻️ Restored {len(rows)} conversation sessions")
+
+    async def flush(self):
+        """Write every changed session to Postgres in one batch"""
+        if self._database is None or not (self._dirty or self._deleted or self._pending):
+            return
+
+        dirty, deleted, pending = self._dirty, self._deleted, self._pending
+        self._dirty, self._deleted, self._pending = set(), set(), {}
+        upserts = dict(pending)
+        upserts.update((key, self._sessions[key]) for key in dirty if key in self._sessions)
+
+        try:
+            async with self._database.acquire() as conn:
+                async with conn.transaction():
+                    if deleted:
+                        await conn.execute(
+                            DELETE_SESSIONS,
+                            [key[0] for key in deleted],
+                            [key[1] for key in deleted]
+                        )
+                    if upserts:
+                        await conn.execute(
+                            UPSERT_SESSIONS,
+                            [key[0] for key in upserts],
+                            [key[1] for key in upserts],
+                            [session.to_json() for session in upserts.values()],
+                            [session.wall_time() for session in upserts.values()]
+                        )
+        except Exception as e:
+            print(f"Conversation flush error: {e}")
+            # put everything back that hasn't changed since, and retry next round
+            self._deleted |= {key for key in deleted if key not in self}
+            self._dirty |= {key for key in dirty if key in self._sessions}
+            for key, session in pending.items():
+                if key not in self._sessions and key not in self._deleted:
+                    self._pending.setdefault(key, session)
+            return
+
+        for key, session in pending.items():
+            if key not in self._sessions and key not in self._deleted:
+                self._evicted[key] = session.last_seen
+
+    async def run_flusher(self):
+        while True:
+            await asyncio.sleep(HISTORY_FLUSH_INTERVAL)
+            await self.flush()
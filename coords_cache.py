@@ -0,0 +1,155 @@
+"""Read-through cache of the coordinates table, kept fresh with LISTEN/NOTIFY.
+
+Every write sends a pg_notify on CHANNEL inside the same transaction, so
+the notification goes out exactly when the change commits. Each bot
+process keeps one listening connection and applies changes made by other
+processes to its own copy. While that connection is down the cache is
+marked stale: the next read reloads from the database, and if the
+database can't answer in time the last known copy is served instead.
+"""
+import asyncio
+import json
+import uuid
+
+import asyncpg
+
+from coords_index import CoordinateIndex
+from db import DatabaseUnavailable
+
+
+CHANNEL = "coordinates_changed"
+REFRESH_TIMEOUT = 5  # seconds a read waits for the database before serving stale data
+
+
+class CoordinateCache:
+    """Coordinates held in a CoordinateIndex, plus a pre-rendered listing"""
+
+    def __init__(self, database, dsn):
+        self._database = database  # db.Database, or None without a database
+        self._dsn = dsn
+        self.index = CoordinateIndex()
+        self.stale = True
+        self.instance_id = uuid.uuid4().hex
+        self._version = 0  # bumped on every change, so reloads can spot races
+        self._listing = None
+
+    @property
+    def loaded(self):
+        return self.index.loaded
+
+    def _changed(self):
+        self._version += 1
+        self._listing = None
+
+    async def refresh(self, timeout=REFRESH_TIMEOUT):
+        """Reload from the database; returns False (keeping the old copy) if it can't"""
+        if self._database is None:
+            return False
+        version = self._version
+        try:
+            async with asyncio.timeout(timeout):
+                async with self._database.acquire() as conn:
+                    rows = await conn.fetch("SELECT name, x, z FROM coordinates")
+        except Exception as e:
+            print(f"Coordinate refresh failed, serving cached copy: {e}")
+            return False
+        self.index.load(rows)
+        self._listing = None
+        # a change that landed mid-query may not be in rows; reload next time
+        self.stale = self._version != version
+        return True
+
+    async def ensure_loaded(self):
+        """Make sure there is something to answer from; refreshes when stale"""
+        if self.stale or not self.loaded:
+            await self.refresh()
+        return self.loaded
+
+    async def rows(self):
+        """All coordinates as {name, x, z}"""
+        await self.ensure_loaded()
+        return self.index.all()
+
+    async def listing(self):
+        """The coordinate list rendered for chat, or "" when there are none"""
+        await self.ensure_loaded()
+        if self._listing is None:
+            self._listing = "\n\n".join(
+                f"{c['name']}: X={c['x']}, Z={c['z']}" for c in self.index.all()
+            )
+        return self._listing
+
+    async def _write(self, query, args, change):
+        if self._database is None:
+            raise DatabaseUnavailable("no database configured")
+        async with self._database.acquire() as conn:
+            async with conn.transaction():
+                await conn.execute(query, *args)
+                await conn.execute(
+                    "SELECT pg_notify($1, $2)",
+                    CHANNEL, json.dumps(dict(change, origin=self.instance_id))
+                )
+        self._apply(change)
+
+    async def add(self, name, x, z):
+        await self._write(
+            "INSERT INTO coordinates (name, x, z) VALUES ($1, $2, $3)",
+            (name, x, z),
+            {"op": "add", "name": name, "x": x, "z": z}
+        )
+
+    async def delete(self, name):
+        await self._write(
+            "DELETE FROM coordinates WHERE name = $1",
+            (name,),
+            {"op": "delete", "name": name}
+        )
+
+    def _apply(self, change):
+        self._changed()
+        if not self.loaded:
+            return
+        if change["op"] == "add":
+            point = (change["name"], change["x"], change["z"])
+            if point in self.index:
+                # a refresh may already have picked the row up; only the table knows if it's there twice
+                self.stale = True
+            else:
+                self.index.add(*point)
+        elif change["op"] == "delete":
+            self.index.remove(change["name"])
+        else:
+            self.stale = True
+
+    def _on_notify(self, connection, pid, channel, payload):
+        try:
+            change = json.loads(payload)
+        except ValueError:
+            self.stale = True
+            return
+        if change.get("origin") != self.instance_id:
+            self._apply(change)
+
+    async def run_listener(self):
+        """Hold a LISTEN connection open, reconnecting with backoff"""
+        delay = 1
+        while True:
+            conn = None
+            try:
+                conn = await asyncpg.connect(self._dsn)
+                closed = asyncio.Event()
+                conn.add_termination_listener(lambda connection: closed.set())
+                await conn.add_listener(CHANNEL, self._on_notify)
+                # changes may have happened while nobody was listening
+                self.stale = True
+                delay = 1
+                print("👂 Listening for coordinate changes")
+                await closed.wait()
+            except Exception as e:
+                print(f"Coordinate listener error: {e}")
+            finally:
+                if conn is not None and not conn.is_closed():
+                    await conn.close()
+            self.stale = True
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 60)
@@ -0,0 +1,117 @@
+"""In-memory spatial index over saved coordinates.
+
+A uniform grid keyed by (x // CELL_SIZE, z // CELL_SIZE). Nearest-point
+queries search outward ring by ring and stop once no unvisited cell can
+hold anything closer; radius queries only visit cells overlapping the
+search square. When a search would touch more grid cells than there are
+occupied ones, it scans the occupied cells instead, which keeps sparse
+worlds (a few far-apart bases) cheap too.
+"""
+import math
+
+
+CELL_SIZE = 256  # blocks per grid cell
+
+
+class CoordinateIndex:
+    """Named (x, z) points with nearest and within-radius lookups"""
+
+    def __init__(self, cell_size=CELL_SIZE):
+        self.cell_size = cell_size
+        self._cells = {}  # (cx, cz) -> [(name, x, z)]
+        self._by_name = {}  # name -> [(name, x, z)], in insertion order
+        self.loaded = False
+
+    def __len__(self):
+        return sum(len(points) for points in self._by_name.values())
+
+    def _cell(self, x, z):
+        return (x // self.cell_size, z // self.cell_size)
+
+    def load(self, rows):
+        """Replace the contents with rows of {name, x, z}"""
+        self._cells = {}
+        self._by_name = {}
+        for row in rows:
+            self.add(row["name"], row["x"], row["z"])
+        self.loaded = True
+
+    def __contains__(self, point):
+        """True if exactly this (name, x, z) is indexed"""
+        return point in self._by_name.get(point[0], ())
+
+    def add(self, name, x, z):
+        point = (name, x, z)
+        self._cells.setdefault(self._cell(x, z), []).append(point)
+        self._by_name.setdefault(name, []).append(point)
+
+    def remove(self, name):
+        """Drop every point with this name; returns how many were removed"""
+        points = self._by_name.pop(name, [])
+        for point in points:
+            cell = self._cell(point[1], point[2])
+            bucket = self._cells[cell]
+            bucket.remove(point)
+            if not bucket:
+                del self._cells[cell]
+        return len(points)
+
+    def all(self):
+        """Every point as {name, x, z}, grouped by name in insertion order"""
+        return [{"name": name, "x": x, "z": z}
+                for points in self._by_name.values() for name, x, z in points]
+
+    def _ring(self, cx, cz, ring):
+        if ring == 0:
+            yield (cx, cz)
+            return
+        for dx in range(-ring, ring + 1):
+            yield (cx + dx, cz - ring)
+            yield (cx + dx, cz + ring)
+        for dz in range(-ring + 1, ring):
+            yield (cx - ring, cz + dz)
+            yield (cx + ring, cz + dz)
+
+    def nearest(self, x, z, k=1):
+        """The k closest points as [(distance, name, px, pz)], closest first"""
+        if not self._cells:
+            return []
+        cx, cz = self._cell(x, z)
+        found = []
+        ring = 0
+        probed = 0
+        while True:
+            probed += max(1, 8 * ring)
+            if probed > len(self._cells):
+                # rings now cost more than looking at every occupied cell
+                found = [point for points in self._cells.values() for point in points]
+                break
+            for cell in self._ring(cx, cz, ring):
+                found.extend(self._cells.get(cell, ()))
+            # anything outside rings 0..ring is at least ring * cell_size away
+            if len(found) >= k:
+                kth = sorted((px - x) ** 2 + (pz - z) ** 2 for _, px, pz in found)[k - 1]
+                if kth <= (ring * self.cell_size) ** 2:
+                    break
+            ring += 1
+        found.sort(key=lambda point: (point[1] - x) ** 2 + (point[2] - z) ** 2)
+        return [(math.dist((x, z), (px, pz)), name, px, pz) for name, px, pz in found[:k]]
+
+    def within(self, x, z, radius):
+        """Points within radius blocks as [(distance, name, px, pz)], closest first"""
+        low_x, low_z = self._cell(x - radius, z - radius)
+        high_x, high_z = self._cell(x + radius, z + radius)
+        if (high_x - low_x + 1) * (high_z - low_z + 1) > len(self._cells):
+            buckets = self._cells.values()
+        else:
+            buckets = [self._cells.get((cx, cz), ())
+                       for cx in range(low_x, high_x + 1) for cz in range(low_z, high_z + 1)]
+        limit = radius * radius
+        hits = []
+        for points in buckets:
+            for name, px, pz in points:
+                distance = (px - x) ** 2 + (pz - z) ** 2
+                if distance <= limit:
+                    hits.append((math.sqrt(distance), name, px, pz))
+        hits.sort()
+        return hits
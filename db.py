@@ -0,0 +1,247 @@
+"""Database access for the bot: one asyncpg pool behind a circuit breaker.
+
+- Queries are registered once by name and run through asyncpg's
+  per-connection statement cache, so each one is parsed and planned once
+  per connection instead of on every call.
+- Health checks are lazy: a SELECT 1 only happens after a connection
+  error or when the pool has been idle for DB_IDLE_CHECK seconds, not in
+  front of every query.
+- After DB_BREAKER_THRESHOLD consecutive connection failures the breaker
+  opens and calls fail fast with DatabaseUnavailable for
+  DB_BREAKER_RESET seconds; then one trial call is let through. A trial
+  that never reports back (e.g. cancelled by a caller's timeout) doesn't
+  leave it half-open: another trial is allowed DB_BREAKER_RESET later.
+- Pool sizing comes from DB_POOL_MIN / DB_POOL_MAX / DB_COMMAND_TIMEOUT.
+- When a check of a possibly cold database (pool missing, failing, or
+  idle past DB_IDLE_CHECK) needed a retry or took DB_WAKE_MIN seconds or
+  more, the time from the first connect attempt to a successful SELECT 1
+  is recorded as a wake-up. Checks the database answered right away
+  aren't wake-ups and stay out, so they can't drag wake_estimate()
+  down. The pre-warmer plans its lead time with that estimate.
+"""
+import asyncio
+import contextlib
+import os
+import time
+from collections import deque
+
+import asyncpg
+
+from metrics import DB_WAKE
+
+
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", "1"))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", "5"))
+DB_COMMAND_TIMEOUT = float(os.getenv("DB_COMMAND_TIMEOUT", "60"))
+DB_IDLE_CHECK = float(os.getenv("DB_IDLE_CHECK", "300"))
+DB_BREAKER_THRESHOLD = int(os.getenv("DB_BREAKER_THRESHOLD", "3"))
+DB_BREAKER_RESET = float(os.getenv("DB_BREAKER_RESET", "30"))
+DB_WAKE_DEFAULT = float(os.getenv("DB_WAKE_DEFAULT", "10"))  # assumed wake time until one has been measured
+DB_WAKE_SAMPLES = 20  # recent wake-ups wake_estimate() looks at
+DB_WAKE_MIN = 0.5  # seconds; a first check faster than this found the database already awake
+
+# Errors that mean "the database is unreachable", as opposed to a bad query
+CONNECTION_ERRORS = (
+    OSError,
+    asyncio.TimeoutError,
+    asyncpg.PostgresConnectionError,
+    asyncpg.InterfaceError,
+    asyncpg.CannotConnectNowError,
+)
+
+
+class DatabaseUnavailable(Exception):
+    """Raised instead of waiting on a database the breaker considers down"""
+
+
+class CircuitBreaker:
+    """closed -> open after `threshold` failures -> half-open after `reset` seconds"""
+
+    def __init__(self, threshold=DB_BREAKER_THRESHOLD, reset=DB_BREAKER_RESET):
+        self.threshold = threshold
+        self.reset = reset
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+
+    def allow(self):
+        if self.state == "closed":
+            return True
+        now = time.monotonic()
+        if now - self.opened_at >= self.reset:
+            # open: let exactly one trial through; half-open: the last trial never reported back
+            self.state = "half-open"
+            self.opened_at = now
+            return True
+        return False
+
+    def success(self):
+        self.state = "closed"
+        self.failures = 0
+
+    def failure(self):
+        self.failures += 1
+        if self.state == "half-open" or self.failures >= self.threshold:
+            if self.state != "open":
+                print(f"⚡ Database circuit opened after {self.failures} failures")
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+
+class Database:
+    """The bot's connection pool plus its named statements"""
+
+    def __init__(self, dsn, min_size=DB_POOL_MIN, max_size=DB_POOL_MAX, command_timeout=DB_COMMAND_TIMEOUT):
+        self.dsn = dsn
+        self.min_size = min_size
+        self.max_size = max_size
+        self.command_timeout = command_timeout
+        self.pool = None
+        self.breaker = CircuitBreaker()
+        self.statements = {}
+        self.last_ok = 0.0
+        self.suspect = True  # nothing verified yet
+        self.wake_times = deque(maxlen=DB_WAKE_SAMPLES)
+        self._lock = asyncio.Lock()
+
+    def register(self, name, sql):
+        """Name a statement so callers can run it with fetch/fetchrow/fetchval/execute"""
+        self.statements[name] = sql
+        return name
+
+    def _ok(self):
+        self.breaker.success()
+        self.suspect = False
+        self.last_ok = time.monotonic()
+
+    def _failed(self, error):
+        self.breaker.failure()
+        self.suspect = True
+
+    def _cold(self):
+        """True when the next check may have to wake the database, not just confirm it's up"""
+        return (self.pool is None or self.breaker.failures > 0
+                or time.monotonic() - self.last_ok >= DB_IDLE_CHECK)
+
+    def _woke(self, started, retried):
+        elapsed = time.monotonic() - started
+        if not retried and elapsed < DB_WAKE_MIN:
+            return  # it was awake all along
+        self.wake_times.append(elapsed)
+        DB_WAKE.observe(elapsed)
+        if elapsed >= 1:
+            print(f"⏰ Database woke up in {elapsed:.1f}s")
+
+    def wake_estimate(self):
+        """Seconds a cold database takes to answer: the 90th percentile of recent wake-ups"""
+        if not self.wake_times:
+            return DB_WAKE_DEFAULT
+        times = sorted(self.wake_times)
+        return times[min(len(times) - 1, int(len(times) * 0.9))]
+
+    def idle(self):
+        """Seconds since the database last answered"""
+        return time.monotonic() - self.last_ok
+
+    @property
+    def healthy(self):
+        """True when the pool exists and nothing suggests it's broken or gone cold"""
+        return (self.pool is not None and not self.suspect
+                and time.monotonic() - self.last_ok < DB_IDLE_CHECK)
+
+    async def _check(self):
+        async with self._lock:
+            if self.healthy:
+                return
+            if self.pool is None:
+                self.pool = await asyncpg.create_pool(
+                    self.dsn,
+                    min_size=self.min_size,
+                    max_size=self.max_size,
+                    command_timeout=self.command_timeout
+                )
+            async with self.pool.acquire() as conn:
+                await conn.execute("SELECT 1")
+            self._ok()
+
+    async def ensure(self, retries=6, base_delay=1, force=False):
+        """Make sure the pool is usable, health-checking only when needed.
+
+        force=True ignores an open breaker, for jobs whose point is to wake the database.
+        """
+        if self.healthy:
+            return True
+        started, cold = time.monotonic(), self._cold()
+        for attempt in range(retries):
+            if not force and not self.breaker.allow():
+                return False
+            try:
+                await self._check()
+                if cold:
+                    self._woke(started, retried=attempt > 0)
+                return True
+            except Exception as e:
+                print(f"DB ensure attempt {attempt+1} failed: {e}")
+                self._failed(e)
+            if attempt < retries - 1:
+                await asyncio.sleep(base_delay * (2 ** attempt))  # exponential backoff
+        return False
+
+    async def warm(self, retries=4):
+        """Force a real round-trip, waking the database if it went to sleep"""
+        self.suspect = True
+        return await self.ensure(retries=retries, force=True)
+
+    @contextlib.asynccontextmanager
+    async def acquire(self, timeout=None):
+        """Pool connection guarded by the breaker; raises DatabaseUnavailable when it's open"""
+        if not self.breaker.allow():
+            raise DatabaseUnavailable("database circuit is open")
+        if not self.healthy:
+            started, cold = time.monotonic(), self._cold()
+            try:
+                await self._check()
+                if cold:
+                    self._woke(started, retried=False)
+            except asyncio.CancelledError as e:
+                self._failed(e)  # a caller gave up waiting; count it, or a half-open trial is never settled
+                raise
+            except Exception as e:
+                self._failed(e)
+                raise DatabaseUnavailable(str(e)) from e
+        try:
+            async with self.pool.acquire(timeout=timeout) as conn:
+                yield conn
+        except CONNECTION_ERRORS as e:
+            self._failed(e)
+            raise
+        else:
+            self._ok()
+
+    async def fetch(self, name, *args, timeout=None):
+        async with self.acquire() as conn:
+            return await conn.fetch(self.statements[name], *args, timeout=timeout)
+
+    async def fetchrow(self, name, *args, timeout=None):
+        async with self.acquire() as conn:
+            return await conn.fetchrow(self.statements[name], *args, timeout=timeout)
+
+    async def fetchval(self, name, *args, timeout=None):
+        async with self.acquire() as conn:
+            return await conn.fetchval(self.statements[name], *args, timeout=timeout)
+
+    async def execute(self, name, *args, timeout=None):
+        async with self.acquire() as conn:
+            return await conn.execute(self.statements[name], *args, timeout=timeout)
+
+    def stats(self):
+        stats = {"breaker": self.breaker.state, "size": 0, "idle": 0, "max": self.max_size}
+        if self.pool is not None:
+            stats["size"] = self.pool.get_size()
+            stats["idle"] = self.pool.get_idle_size()
+        return stats
+
+    async def close(self):
+        if self.pool is not None:
+            await self.pool.close()
+            self.pool = None
@@ -0,0 +1,108 @@
+"""Shared async DeepSeek client used by every LLM call in the bot."""
+import asyncio
+import os
+import time
+
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient, DEFAULT_CONNECTION_LIMITS
+
+from metrics import LLM_FIRST_TOKEN, LLM_LATENCY
+
+
+DEEPSEEK_API_KEY = os.getenv("DEEPSEEK_API_KEY")
+DEEPSEEK_BASE_URL = os.getenv("DEEPSEEK_BASE_URL", "https://api.deepseek.com")
+DEEPSEEK_MODEL = os.getenv("DEEPSEEK_MODEL", "deepseek-chat")
+
+LLM_MAX_INFLIGHT = int(os.getenv("LLM_MAX_INFLIGHT", "8"))  # concurrent requests to DeepSeek
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "30"))  # seconds per call
+LLM_KEEPALIVE = float(os.getenv("LLM_KEEPALIVE", "120"))  # keep idle connections this long
+
+_client = None
+_inflight = asyncio.Semaphore(LLM_MAX_INFLIGHT)
+
+
+def get_client():
+    """Create the pooled AsyncOpenAI client on first use"""
+    global _client
+    if _client is None:
+        # httpx.Limits, reached through openai so we don't pin httpx ourselves
+        limits = type(DEFAULT_CONNECTION_LIMITS)(
+            max_connections=LLM_MAX_INFLIGHT,
+            max_keepalive_connections=LLM_MAX_INFLIGHT,
+            keepalive_expiry=LLM_KEEPALIVE,
+        )
+        _client = AsyncOpenAI(
+            api_key=DEEPSEEK_API_KEY,
+            base_url=DEEPSEEK_BASE_URL,
+            max_retries=0,  # callers do their own retry/backoff
+            timeout=LLM_TIMEOUT,
+            http_client=DefaultAsyncHttpxClient(limits=limits),
+        )
+    return _client
+
+
+async def chat(messages, timeout=None, **kwargs):
+    """Run one chat completion and return the reply text"""
+    async with _inflight:
+        with LLM_LATENCY.timer(mode="chat"):
+            response = await get_client().chat.completions.create(
+                model=DEEPSEEK_MODEL,
+                messages=messages,
+                stream=False,
+                timeout=timeout or LLM_TIMEOUT,
+                **kwargs
+            )
+    return response.choices[0].message.content.strip()
+
+
+async def _read_stream(messages, deltas, timeout, kwargs):
+    """Drain a DeepSeek stream into a queue, ending it with None"""
+    try:
+        async with _inflight:
+            with LLM_LATENCY.timer(mode="stream"):
+                started = time.perf_counter()
+                first = True
+                stream = await get_client().chat.completions.create(
+                    model=DEEPSEEK_MODEL,
+                    messages=messages,
+                    stream=True,
+                    timeout=timeout or LLM_TIMEOUT,
+                    **kwargs
+                )
+                async for chunk in stream:
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        if first:
+                            LLM_FIRST_TOKEN.observe(time.perf_counter() - started)
+                            first = False
+                        deltas.put_nowait(chunk.choices[0].delta.content)
+    finally:
+        deltas.put_nowait(None)
+
+
+async def stream_chat(messages, timeout=None, **kwargs):
+    """Yield reply text deltas as DeepSeek streams them.
+
+    The stream is read by its own task, so the LLM slot and the latency
+    timer are released as soon as DeepSeek is done, however long the
+    caller spends on Discord between deltas.
+    """
+    deltas = asyncio.Queue()
+    reader = asyncio.create_task(_read_stream(messages, deltas, timeout, kwargs))
+    try:
+        while (delta := await deltas.get()) is not None:
+            yield delta
+        await reader  # raises whatever ended the stream early
+    finally:
+        reader.cancel()
+
+
+def inflight():
+    """Calls currently holding an LLM slot"""
+    return LLM_MAX_INFLIGHT - _inflight._value
+
+
+async def close():
+    """Close pooled connections on shutdown"""
+    global _client
+    if _client is not None:
+        await _client.close()
+        _client = None
@@ -0,0 +1,125 @@
+"""Local imitation of DeepSeek's OpenAI-compatible chat-completions API.
+
+Answers POST /chat/completions, streamed (SSE) or not, after a tunable
+delay, and fails a tunable share of requests with 500s or 429s, so the
+bot's LLM path can be loaded without spending tokens.
+
+    python loadtest/fake_deepseek.py --port 8090 --latency 1.5 --error-rate 0.02
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+
+from aiohttp import web
+
+REPLY = "wkwk santai bro, kodok lagi mikir keras nih. intinya sih gitu deh, jangan dipikirin banget 🐸"
+
+
+class FakeDeepSeek:
+    """latency: seconds to first token; token_interval: seconds between streamed tokens"""
+
+    def __init__(self, latency=1.0, jitter=0.5, token_interval=0.03, error_rate=0.0, rate_limit_rate=0.0, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.token_interval = token_interval
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.rng = random.Random(seed)
+        self.requests = 0
+        self.errors = 0
+        self.rate_limited = 0
+        self.inflight = 0
+        self.peak_inflight = 0
+
+    def app(self):
+        app = web.Application()
+        app.router.add_post("/chat/completions", self.handle)
+        app.router.add_post("/v1/chat/completions", self.handle)
+        return app
+
+    def _delay(self):
+        return max(0.0, self.rng.gauss(self.latency, self.jitter * self.latency))
+
+    def _chunk(self, completion_id, model, delta, finish_reason=None):
+        return {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        }
+
+    async def handle(self, request):
+        body = await request.json()
+        self.requests += 1
+        self.inflight += 1
+        self.peak_inflight = max(self.peak_inflight, self.inflight)
+        try:
+            roll = self.rng.random()
+            if roll < self.rate_limit_rate:
+                self.rate_limited += 1
+                return web.json_response(
+                    {"error": {"message": "Rate limit reached", "type": "rate_limit_error"}},
+                    status=429, headers={"Retry-After": "1"},
+                )
+            await asyncio.sleep(self._delay())
+            if roll < self.rate_limit_rate + self.error_rate:
+                self.errors += 1
+                return web.json_response({"error": {"message": "Internal error", "type": "server_error"}}, status=500)
+
+            completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+            model = body.get("model", "deepseek-chat")
+            if body.get("stream"):
+                return await self._stream(request, completion_id, model)
+            return web.json_response({
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": REPLY}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": 100, "completion_tokens": len(REPLY.split()), "total_tokens": 100 + len(REPLY.split())},
+            })
+        finally:
+            self.inflight -= 1
+
+    async def _stream(self, request, completion_id, model):
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream", "Cache-Control": "no-cache"})
+        await response.prepare(request)
+        await self._send(response, self._chunk(completion_id, model, {"role": "assistant", "content": ""}))
+        for word in REPLY.split(" "):
+            await self._send(response, self._chunk(completion_id, model, {"content": word + " "}))
+            await asyncio.sleep(self.token_interval)
+        await self._send(response, self._chunk(completion_id, model, {}, "stop"))
+        await response.write(b"data: [DONE]\n\n")
+        await response.write_eof()
+        return response
+
+    async def _send(self, response, chunk):
+        await response.write(f"data: {json.dumps(chunk)}\n\n".encode())
+
+    def stats(self):
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "rate_limited": self.rate_limited,
+            "peak_inflight": self.peak_inflight,
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake DeepSeek chat-completions server")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--latency", type=float, default=1.0)
+    parser.add_argument("--jitter", type=float, default=0.5)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    args = parser.parse_args()
+    fake = FakeDeepSeek(args.latency, args.jitter, error_rate=args.error_rate, rate_limit_rate=args.rate_limit_rate)
+    web.run_app(fake.app(), host="127.0.0.1", port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+"""Local Discord stand-ins: a REST sink and a gateway that injects events.
+
+FakeDiscord answers the REST calls the bot makes while replying (send,
+edit, typing, plus the two login lookups) and enforces per-channel rate
+limits the way Discord does: X-RateLimit-* headers on every response and
+a 429 with retry_after once a channel's window is used up. It records
+when each reply arrives, keyed by the message it replies to.
+
+FakeGateway plays the other side: it creates a guild in the bot's
+connection state and feeds MESSAGE_CREATE payloads through the same
+parser discord.py uses for real gateway events, so on_message runs with
+real discord.Message objects.
+"""
+import datetime
+import itertools
+import json
+import time
+
+import discord
+from aiohttp import web
+
+BOT_USER_ID = 100000000000000001
+API = "/api/v10"
+
+
+def json_response(data, status=200, headers=None):
+    """Like web.json_response, but with the bare content type discord.py checks for"""
+    headers = dict(headers or {}, **{"Content-Type": "application/json"})
+    return web.Response(body=json.dumps(data).encode(), status=status, headers=headers)
+
+
+def snowflakes():
+    """Unique, time-ordered snowflake ids"""
+    counter = itertools.count()
+    while True:
+        yield discord.utils.time_snowflake(discord.utils.utcnow()) + next(counter) % 4096
+
+
+def user_payload(user_id, bot=False):
+    return {"id": str(user_id), "username": f"user{user_id}", "discriminator": "0",
+            "avatar": None, "global_name": None, "bot": bot}
+
+
+def message_payload(message_id, channel_id, author, content, guild_id=None, reference=None):
+    payload = {
+        "id": str(message_id),
+        "channel_id": str(channel_id),
+        "author": author,
+        "content": content,
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "edited_timestamp": None,
+        "tts": False,
+        "mention_everyone": False,
+        "mentions": [],
+        "mention_roles": [],
+        "attachments": [],
+        "embeds": [],
+        "pinned": False,
+        "type": 19 if reference else 0,
+    }
+    if guild_id is not None:
+        payload["guild_id"] = str(guild_id)
+    if reference:
+        payload["message_reference"] = reference
+    return payload
+
+
+class Window:
+    """Fixed rate-limit window, like one of Discord's per-route buckets"""
+    __slots__ = ("limit", "per", "reset_at", "used")
+
+    def __init__(self, limit, per):
+        self.limit = limit
+        self.per = per
+        self.reset_at = 0.0
+        self.used = 0
+
+    def take(self, now):
+        if now >= self.reset_at:
+            self.reset_at = now + self.per
+            self.used = 0
+        if self.used >= self.limit:
+            return False
+        self.used += 1
+        return True
+
+    def headers(self, now, bucket):
+        reset_after = max(0.0, self.reset_at - now)
+        return {
+            "X-RateLimit-Limit": str(self.limit),
+            "X-RateLimit-Remaining": str(max(0, self.limit - self.used)),
+            "X-RateLimit-Reset": f"{time.time() + reset_after:.3f}",
+            "X-RateLimit-Reset-After": f"{reset_after:.3f}",
+            "X-RateLimit-Bucket": bucket,
+        }
+
+
+class FakeDiscord:
+    """REST sink; channel_rate is (requests, seconds) per channel for sends and for edits"""
+
+    def __init__(self, channel_rate=(5, 5.0)):
+        self.channel_rate = channel_rate
+        self.ids = snowflakes()
+        self.replies = {}  # replied-to message id -> monotonic time of the first reply
+        self.sent = 0
+        self.edits = 0
+        self.typing = 0
+        self.rate_limited = 0
+        self._windows = {}
+
+    def app(self):
+        app = web.Application()
+        app.router.add_get(f"{API}/users/@me", self.me)
+        app.router.add_get(f"{API}/oauth2/applications/@me", self.application)
+        app.router.add_post(f"{API}/channels/{{channel_id}}/messages", self.create_message)
+        app.router.add_patch(f"{API}/channels/{{channel_id}}/messages/{{message_id}}", self.edit_message)
+        app.router.add_post(f"{API}/channels/{{channel_id}}/typing", self.trigger_typing)
+        return app
+
+    async def me(self, request):
+        return json_response(user_payload(BOT_USER_ID, bot=True))
+
+    async def application(self, request):
+        return json_response({
+            "id": str(BOT_USER_ID), "name": "Metal Kodok", "description": "", "icon": None,
+            "bot_public": False, "bot_require_code_grant": False, "verify_key": "",
+            "owner": user_payload(1), "flags": 0,
+        })
+
+    def _limit(self, route, channel_id):
+        """(None, headers) if the request may go through, else (429 response, headers)"""
+        now = time.monotonic()
+        key = (route, channel_id)
+        window = self._windows.get(key)
+        if window is None:
+            window = self._windows[key] = Window(*self.channel_rate)
+        allowed = window.take(now)
+        headers = window.headers(now, f"{route}:{channel_id}")
+        if allowed:
+            return None, headers
+        self.rate_limited += 1
+        retry_after = float(headers["X-RateLimit-Reset-After"])
+        headers.update({"Retry-After": str(retry_after), "X-RateLimit-Scope": "user"})
+        return json_response(
+            {"message": "You are being rate limited.", "retry_after": retry_after, "global": False},
+            status=429, headers=headers,
+        ), headers
+
+    async def create_message(self, request):
+        channel_id = request.match_info["channel_id"]
+        limited, headers = self._limit("messages", channel_id)
+        if limited is not None:
+            return limited
+        body = await request.json()
+        reference = body.get("message_reference")
+        if reference:
+            self.replies.setdefault(int(reference["message_id"]), time.monotonic())
+        self.sent += 1
+        payload = message_payload(next(self.ids), channel_id, user_payload(BOT_USER_ID, bot=True),
+                                  body.get("content", ""), reference=reference)
+        return json_response(payload, headers=headers)
+
+    async def edit_message(self, request):
+        channel_id = request.match_info["channel_id"]
+        limited, headers = self._limit("edits", channel_id)
+        if limited is not None:
+            return limited
+        body = await request.json()
+        self.edits += 1
+        payload = message_payload(request.match_info["message_id"], channel_id,
+                                  user_payload(BOT_USER_ID, bot=True), body.get("content", ""))
+        return json_response(payload, headers=headers)
+
+    async def trigger_typing(self, request):
+        self.typing += 1
+        return web.Response(status=204)
+
+    def stats(self):
+        return {"sent": self.sent, "edits": self.edits, "typing": self.typing, "served_429": self.rate_limited}
+
+
+class FakeGateway:
+    """Feeds gateway events into a logged-in bot's connection state"""
+
+    def __init__(self, bot, guild_id=200000000000000001):
+        self.bot = bot
+        self.guild_id = guild_id
+        self.ids = snowflakes()
+
+    def create_guild(self, channel_ids):
+        state = self.bot._connection
+        state._add_guild_from_data({
+            "id": str(self.guild_id),
+            "name": "loadtest",
+            "owner_id": "1",
+            "member_count": 0,
+            "roles": [{"id": str(self.guild_id), "name": "@everyone", "permissions": "0", "position": 0,
+                       "color": 0, "hoist": False, "managed": False, "mentionable": False}],
+            "channels": [
+                {"id": str(channel_id), "type": 0, "name": f"load-{i}", "position": i,
+                 "permission_overwrites": [], "guild_id": str(self.guild_id)}
+                for i, channel_id in enumerate(channel_ids)
+            ],
+            "members": [],
+        })
+
+    def message(self, channel_id, user_id, content):
+        """Dispatch one MESSAGE_CREATE; returns the new message id"""
+        message_id = next(self.ids)
+        payload = message_payload(message_id, channel_id, user_payload(user_id), content, guild_id=self.guild_id)
+        payload["member"] = {"roles": [], "joined_at": payload["timestamp"], "deaf": False, "mute": False}
+        self.bot._connection.parse_message_create(payload)
+        return message_id
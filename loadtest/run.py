@@ -0,0 +1,237 @@
+"""Replay a chat trace through the real bot against local stand-ins.
+
+Starts a fake DeepSeek server and a fake Discord REST sink, logs the bot
+in against the sink, creates a guild through the fake gateway and then
+feeds it MESSAGE_CREATE events at the requested rate. Everything from
+on_message on is the production code path: routing, history, the LLM
+client, the send scheduler and discord.py's own HTTP rate limiting.
+
+    python loadtest/run.py --rate 20 --messages 2000
+    python loadtest/run.py --trace chat.jsonl --speed 4 --llm-latency 3
+    python loadtest/run.py --rate 50 --llm-error-rate 0.05 --out report.json
+
+A trace is JSON lines of {"channel": id, "user": id, "content": "...",
+"at": seconds}; "at" is optional and only used without --rate. Without
+--trace a synthetic one is generated: a mix of chatter and "woi kodok"
+openers (follow-ups from users with a live session also go to the LLM).
+
+The report covers throughput, reply latency percentiles (message in to
+reply received by the sink), send-queue depth over time, 429s served and
+retried, fake DeepSeek load and the bot's per-stage tracing summary.
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import random
+import sys
+import time
+
+from aiohttp import web
+
+from fake_deepseek import FakeDeepSeek
+from fake_discord import FakeDiscord, FakeGateway
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+
+CHATTER = [
+    "lol", "gg wp", "anyone up for valorant tonight?", "wkwkwkwk", "ok",
+    "bro the creeper blew up my whole base 💀", "what time is it over there",
+    "nah i think the nether update was better honestly",
+]
+QUESTIONS = [
+    "woi kodok menurutmu nasi goreng atau mie goreng?",
+    "woi kodok kasih tips main minecraft dong",
+    "woi kodok kenapa langit biru",
+    "woi kodok ceritain jokes dong",
+    "woi kodok siapa yang paling ganteng di server ini",
+]
+
+
+def synthetic_trace(count, users, channels, llm_share, seed=0):
+    rng = random.Random(seed)
+    for _ in range(count):
+        content = rng.choice(QUESTIONS) if rng.random() < llm_share else rng.choice(CHATTER)
+        yield {"channel": rng.randrange(channels) + 1, "user": rng.randrange(users) + 1, "content": content}
+
+
+def load_trace(path):
+    with open(path, encoding="utf-8") as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+
+def percentiles(values):
+    if not values:
+        return {}
+    values = sorted(values)
+    last = len(values) - 1
+    result = {f"p{int(q * 100)}": values[min(last, int(q * len(values)))] for q in (0.5, 0.95, 0.99)}
+    result["max"] = values[-1]
+    return result
+
+
+async def serve(app):
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}"
+
+
+def handler_tasks():
+    return [task for task in asyncio.all_tasks() if task.get_name() == "discord.py: on_message"]
+
+
+async def run(args):
+    deepseek = FakeDeepSeek(args.llm_latency, args.llm_jitter, args.token_interval,
+                            args.llm_error_rate, args.llm_429_rate, seed=args.seed)
+    discord_sink = FakeDiscord(channel_rate=(args.channel_limit, args.channel_window))
+    deepseek_runner, deepseek_url = await serve(deepseek.app())
+    discord_runner, discord_url = await serve(discord_sink.app())
+
+    # llm.py and main.py read these at import time
+    os.environ.update(DEEPSEEK_BASE_URL=deepseek_url, DEEPSEEK_API_KEY="loadtest",
+                      STREAM_REPLIES="0" if args.no_stream else "1")
+    os.environ.pop("DATABASE_URL", None)
+    import discord
+    with contextlib.redirect_stdout(sys.stderr):
+        import main
+        import llm
+        from tracing import tracer
+    discord.http.Route.BASE = f"{discord_url}/api/v10"
+
+    if args.trace:
+        trace = load_trace(args.trace)
+    else:
+        trace = list(synthetic_trace(args.messages, args.users, args.channels, args.llm_share, args.seed))
+    channel_ids = {}
+    gateway = FakeGateway(main.bot)
+
+    await main.bot.login("loadtest")
+    for entry in trace:
+        channel_ids.setdefault(entry["channel"], next(gateway.ids))
+    gateway.create_guild(channel_ids.values())
+
+    timeline = []
+    dispatched = {}  # message id -> monotonic time it was dispatched
+    start = time.monotonic()
+
+    async def sample():
+        while True:
+            timeline.append({
+                "t": round(time.monotonic() - start, 2),
+                "send_queue": main.message_queue.qsize(),
+                "handlers": len(handler_tasks()),
+                "llm_inflight": llm.inflight(),
+                "replies": len(discord_sink.replies),
+            })
+            await asyncio.sleep(args.sample_interval)
+
+    sampler = asyncio.create_task(sample())
+    log = sys.stderr if args.verbose else open(os.devnull, "w")
+    with contextlib.redirect_stdout(log):
+        for i, entry in enumerate(trace):
+            if args.rate:
+                due = start + i / args.rate
+            else:
+                due = start + entry.get("at", i) / args.speed
+            delay = due - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            message_id = gateway.message(channel_ids[entry["channel"]], entry["user"], entry["content"])
+            dispatched[message_id] = time.monotonic()
+        injected = time.monotonic() - start
+
+        deadline = time.monotonic() + args.drain_timeout
+        while time.monotonic() < deadline:
+            if not handler_tasks() and not main.message_queue.qsize() and not llm.inflight():
+                break
+            await asyncio.sleep(0.1)
+    finished = time.monotonic() - start
+    sampler.cancel()
+
+    latencies = [
+        (discord_sink.replies[message_id] - sent_at) * 1000
+        for message_id, sent_at in dispatched.items() if message_id in discord_sink.replies
+    ]
+    report = {
+        "config": {key: value for key, value in vars(args).items() if key != "out"},
+        "messages": len(dispatched),
+        "offered_rate": len(dispatched) / injected if injected else None,
+        "duration_s": finished,
+        "drained": finished < injected + args.drain_timeout,
+        "replies": len(latencies),
+        "reply_throughput": len(latencies) / finished if finished else None,
+        "reply_latency_ms": percentiles(latencies),
+        "send_queue_max": max((point["send_queue"] for point in timeline), default=0),
+        "discord": dict(discord_sink.stats(), scheduler_429_retries=main.message_queue.rate_limit_hits),
+        "deepseek": deepseek.stats(),
+        "stages_ms": {
+            stage: dict(count=count, **{f"p{int(q * 100)}": seconds * 1000 for q, seconds in quantiles.items()})
+            for stage, (count, quantiles) in tracer.summary().items()
+        },
+        "timeline": timeline,
+    }
+
+    await main.bot.close()
+    await llm.close()
+    await deepseek_runner.cleanup()
+    await discord_runner.cleanup()
+    return report
+
+
+def print_report(report):
+    latency = report["reply_latency_ms"]
+    print(f"messages    {report['messages']} at {report['offered_rate']:.1f}/s, "
+          f"finished in {report['duration_s']:.1f}s{'' if report['drained'] else ' (NOT drained)'}")
+    print(f"replies     {report['replies']} ({report['reply_throughput']:.1f}/s)")
+    if latency:
+        print(f"latency     p50 {latency['p50']:.0f}ms  p95 {latency['p95']:.0f}ms  "
+              f"p99 {latency['p99']:.0f}ms  max {latency['max']:.0f}ms")
+    print(f"send queue  max depth {report['send_queue_max']}")
+    print(f"discord     {report['discord']}")
+    print(f"deepseek    {report['deepseek']}")
+    for stage, numbers in report["stages_ms"].items():
+        print(f"  {stage:<14} n={numbers['count']:<6} p50 {numbers.get('p50', 0):.1f}ms  "
+              f"p95 {numbers.get('p95', 0):.1f}ms  p99 {numbers.get('p99', 0):.1f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--trace", help="JSON lines trace to replay instead of a synthetic one")
+    parser.add_argument("--rate", type=float, help="messages per second (default: trace timing, or 10)")
+    parser.add_argument("--speed", type=float, default=1.0, help="speed-up for trace timing")
+    parser.add_argument("--messages", type=int, default=500, help="synthetic trace length")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--channels", type=int, default=10)
+    parser.add_argument("--llm-share", type=float, default=0.2, help="share of synthetic messages that open a conversation")
+    parser.add_argument("--llm-latency", type=float, default=1.5, help="seconds to first token")
+    parser.add_argument("--llm-jitter", type=float, default=0.3, help="latency std-dev as a share of --llm-latency")
+    parser.add_argument("--token-interval", type=float, default=0.03, help="seconds between streamed tokens")
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    parser.add_argument("--llm-429-rate", type=float, default=0.0)
+    parser.add_argument("--channel-limit", type=int, default=5, help="Discord sends per channel per window")
+    parser.add_argument("--channel-window", type=float, default=5.0)
+    parser.add_argument("--no-stream", action="store_true", help="set STREAM_REPLIES=0")
+    parser.add_argument("--sample-interval", type=float, default=1.0)
+    parser.add_argument("--drain-timeout", type=float, default=120.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--verbose", action="store_true", help="show the bot's own output")
+    parser.add_argument("--out", help="write the full report (with timeline) as JSON")
+    args = parser.parse_args()
+    if not args.trace and not args.rate:
+        args.rate = 10.0
+
+    report = asyncio.run(run(args))
+    print_report(report)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2)
+        print(f"Wrote {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,24 +2,37 @@ import discord
 from discord.ext import commands
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 import random
-import re
 import json
 import os
 import asyncpg
-from openai import OpenAI
-from collections import defaultdict
-from datetime import datetime, timedelta
+from collections import deque
 import asyncio
-from collections import defaultdict
+import contextlib
 from discord import HTTPException
 from apscheduler.triggers.cron import CronTrigger
-from gtts import gTTS
-import tempfile
 import time
+import io
 import subprocess
 from pydub import AudioSegment
 from aiohttp import web
 import asyncio, asyncpg
+import llm
+import metrics
+from tracing import tracer
+from db import Database
+import question_bank
+import tts
+from send_scheduler import SendScheduler
+from router import Router
+from conversation_store import ConversationStore
+from cache import TTLCache
+from coords_cache import CoordinateCache
+from cluster import CLUSTER_ID, LeaderElection, bot_options
+from presence import LOW_MEMORY_MODE, PresenceIndex, PresenceSampler, client_options, member_activities
+from prewarm import PREWARM_TICK, Prewarmer
+from commentary import COMMENTARY_CANDIDATES, COMMENTARY_LEAD, CommentaryBuffer, generate_batch
+from context_window import CONTEXT_TOKEN_BUDGET, clip_to_budget, estimate_tokens, overflow_count
+import hashlib
 
 
 active_tts_user = None
@@ -27,27 +40,25 @@ last_tts_activity = 0
 tts_voice_client = None
 
 
-conversation_histories = defaultdict(list)
-MAX_HISTORY = 5 
+MAX_HISTORY = 20  # hard cap on stored turns; CONTEXT_TOKEN_BUDGET decides what is sent
 SESSION_TIMEOUT = 180 
 
-locks = defaultdict(asyncio.Lock)
 
-
-MESSAGE_COOLDOWN = 1.5 
 USER_COOLDOWN = 3.0 
 
+STREAM_REPLIES = os.getenv("STREAM_REPLIES", "1") == "1"
+STREAM_EDIT_INTERVAL = 1.2  # seconds between edits, keeps us under Discord's 5 edits / 5s
+DISCORD_MESSAGE_LIMIT = 2000
 
-message_queue = asyncio.Queue()
-processing_lock = asyncio.Lock()
+# Opt-in: set LLM_CACHE_TTL (seconds) to reuse replies for repeated prompts
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", "0"))
+LLM_CACHE_SIZE = int(os.getenv("LLM_CACHE_SIZE", "1024"))
+response_cache = TTLCache(LLM_CACHE_SIZE, LLM_CACHE_TTL)
 
 
+message_queue = SendScheduler()
+
 
-DEEPSEEK_API_KEY = os.getenv("DEEPSEEK_API_KEY")
-deepseek_client = OpenAI(
-    api_key=DEEPSEEK_API_KEY,
-    base_url="https://api.deepseek.com"
-)
 
 BOT_NAME = "Metal Kodok"
 PERSONALITY = """
@@ -58,31 +69,69 @@ You’re confident but not overbearing, and you know how to keep the vibe casual
 Keep your responses short, to the point, and engaging. You balance humor with subtlety, making sure everyone in the conversation feels included without focusing too much on any one person.
 """
 
+PING_DB_TIMEOUT = 5  # seconds an external ping may wait on the database
+PING_PORT = int(os.getenv("PING_PORT", "8080")) + CLUSTER_ID  # Railway defaults to 8080; one port per cluster process
+
+
 async def handle_ping(request):
     print("[PING] External ping received, waking DB...")
+    try:
+        async with asyncio.timeout(PING_DB_TIMEOUT):
+            async with database.acquire() as conn:
+                await conn.execute("SELECT 1;")
+    except Exception as e:
+        print(f"[PING] DB wake failed: {e!r}")
+        return web.Response(text="error: database still asleep", status=503)
+    return web.Response(text="pong")
+
+
+async def handle_metrics(request):
+    pool = database.stats()
+    players = dict(tts.players)
+    body = metrics.render(
+        metrics.gauge("kodok_send_queue_depth", "Replies waiting to be sent, all channels", message_queue.qsize()),
+        metrics.gauge("kodok_send_queue_channel_depth", "Replies waiting to be sent, per channel",
+                      {channel_id: depth for channel_id, depth in message_queue.channel_depths().items() if depth},
+                      "channel"),
+        metrics.counter("kodok_rate_limit_hits_total", "429 responses from Discord while sending replies", message_queue.rate_limit_hits),
+        metrics.gauge("kodok_db_pool_size", "Open database connections", pool["size"]),
+        metrics.gauge("kodok_db_pool_idle", "Idle database connections", pool["idle"]),
+        metrics.gauge("kodok_db_pool_max", "Database pool size limit", pool["max"]),
+        metrics.DB_WAKE,
+        metrics.gauge("kodok_db_wake_estimate_seconds", "Wake time the pre-warmer plans with", database.wake_estimate()),
+        metrics.counter("kodok_db_prewarms_total", "Database warm-ups ahead of scheduled jobs", prewarmer.warmups),
+        metrics.counter("kodok_db_keepalives_total", "Database keep-alives during busy hours", prewarmer.keepalives),
+        metrics.counter("kodok_db_prewarm_failures_total", "Warm-ups and keep-alives that failed", prewarmer.failures),
+        metrics.gauge("kodok_db_breaker_open", "1 while the database circuit breaker is not closed", int(pool["breaker"] != "closed")),
+        metrics.gauge("kodok_llm_inflight", "DeepSeek calls in progress", llm.inflight()),
+        metrics.gauge("kodok_llm_inflight_max", "DeepSeek concurrency limit", llm.LLM_MAX_INFLIGHT),
+        metrics.LLM_LATENCY,
+        metrics.LLM_FIRST_TOKEN,
+        metrics.counter("kodok_llm_cache_hits_total", "Replies served from the response cache", response_cache.hits),
+        metrics.counter("kodok_llm_cache_misses_total", "Response cache misses", response_cache.misses),
+        metrics.counter("kodok_commentary_prepared_total", "Stalk slots with commentary prepared ahead of time", commentary_buffer.prepared),
+        metrics.counter("kodok_commentary_used_total", "Stalk posts that used prepared commentary", commentary_buffer.used),
+        metrics.counter("kodok_commentary_stale_total", "Prepared slots that expired or whose members moved on", commentary_buffer.stale),
+        metrics.gauge("kodok_conversation_sessions", "Conversation sessions held in memory", len(conversation_histories)),
+        metrics.TTS_LATENCY,
+        metrics.gauge("kodok_tts_queue_depth", "Utterances waiting per guild", {guild_id: player.depth() for guild_id, player in players.items()}, "guild"),
+        metrics.counter("kodok_tts_cache_hits_total", "TTS audio cache hits", tts.audio_cache.hits),
+        metrics.counter("kodok_tts_cache_misses_total", "TTS audio cache misses", tts.audio_cache.misses),
+        tracer.render(),
+    )
+    return web.Response(body=body.encode(), headers={"Content-Type": metrics.CONTENT_TYPE})
 
-    for attempt in range(5):  # try 5 times
-        try:
-            conn = await asyncpg.connect(DATABASE_URL)
-            await conn.execute("SELECT 1;")
-            await conn.close()
-            print(f"[PING] DB wake successful on attempt {attempt+1}")
-            return web.Response(text="pong")
-        except Exception as e:
-            print(f"[PING] Attempt {attempt+1} failed: {e}")
-            await asyncio.sleep(3)  # wait 3 seconds before retry
 
-    print("[PING] Failed to wake DB after 5 attempts")
-    return web.Response(text="error: database still asleep", status=500)
 async def start_ping_server():
     app = web.Application()
     app.router.add_get("/ping", handle_ping)
+    app.router.add_get("/metrics", handle_metrics)
 
     runner = web.AppRunner(app)
     await runner.setup()
-    site = web.TCPSite(runner, "0.0.0.0", 8080)  # Railway defaults to 8080
+    site = web.TCPSite(runner, "0.0.0.0", PING_PORT)
     await site.start()
-    print("[PING] Ping server started on port 8080")
+    print(f"[PING] Ping server started on port {PING_PORT} (/ping, /metrics)")
 
 async def get_history_key(message):
     """Create a unique key for conversation tracking (user + channel)"""
@@ -91,50 +140,119 @@ async def get_history_key(message):
 
 async def add_to_history(key, role, content):
     """Add message to conversation history"""
-    conversation_histories[key].append({
-        "role": role,
-        "content": content,
-        "timestamp": datetime.now().isoformat()  # Store as ISO string instead of datetime object
-    })
-    if len(conversation_histories[key]) > MAX_HISTORY:
-        conversation_histories[key] = conversation_histories[key][-MAX_HISTORY:]
+    await conversation_histories.load(key)
+    conversation_histories.append(key, role, content)
 
 
 
 async def clear_expired_sessions():
-    """Clean up old conversations more efficiently"""
-    now = datetime.now()
-    expired_keys = []
+    """Drop sessions whose timeout passed; only expired keys are touched"""
+    conversation_histories.expire()
 
-    for key, history in conversation_histories.items():
-        if history:
-            last_timestamp = datetime.fromisoformat(history[-1].get('timestamp', now.isoformat()))
-            if (now - last_timestamp).total_seconds() > SESSION_TIMEOUT:
-                expired_keys.append(key)
 
-  
-    for i in range(0, len(expired_keys), 100):
-        batch = expired_keys[i:i + 100]
-        for key in batch:
-            del conversation_histories[key]
-        await asyncio.sleep(0.5) 
+SUMMARY_PROMPT = "Summarize this chat between a user and a Discord bot in at most 3 short sentences. Keep names, facts and running jokes; the summary will replace the messages."
+
+
+def build_deepseek_messages(history_key):
+    """Build the chat payload: personality prompt, running summary, then the newest turns that fit the token budget"""
+    # PERSONALITY must stay byte-identical at the front so DeepSeek's prefix cache keeps hitting
+    messages = [{"role": "system", "content": PERSONALITY}]
+    session = conversation_histories.get(history_key)
+    if session is None:
+        return messages
+
+    reserved = 0
+    if session.summary:
+        summary = f"Earlier in this conversation: {session.summary}"
+        reserved = estimate_tokens(summary)
+        messages.append({"role": "system", "content": summary})
+
+    turns = list(session.turns)
+    for role, content, tokens in turns[overflow_count(turns, CONTEXT_TOKEN_BUDGET, reserved):]:
+        if tokens > CONTEXT_TOKEN_BUDGET:
+            content = clip_to_budget(content, CONTEXT_TOKEN_BUDGET)
+        messages.append({"role": role, "content": content})
+    return messages
+
+
+async def fold_history(history_key):
+    """Fold turns that no longer fit the token budget into the session's running summary"""
+    session = conversation_histories.get(history_key)
+    if session is None or session.folding:
+        return
+
+    turns = list(session.turns)
+    reserved = estimate_tokens(session.summary) if session.summary else 0
+    count = overflow_count(turns, CONTEXT_TOKEN_BUDGET, reserved)
+    if session.full:
+        count = max(count, 2)  # make room before the deque starts dropping turns
+    if not count:
+        return
 
+    folded = turns[:count]
+    transcript = "\n".join(f"{role}: {content}" for role, content, _ in folded)
+    if session.summary:
+        transcript = f"Summary so far: {session.summary}\n{transcript}"
 
-async def ask_deepseek(history_key, retry_count=3):
+    session.folding = True
+    try:
+        summary = await llm.chat([
+            {"role": "system", "content": SUMMARY_PROMPT},
+            {"role": "user", "content": transcript}
+        ], max_tokens=200)
+    except Exception as e:
+        print(f"History summary failed: {e}")
+        return
+    finally:
+        session.folding = False
+
+    # only drop the turns we summarized, in case the session moved on meanwhile
+    if conversation_histories.get(history_key) is not session:
+        return
+    for turn in folded:
+        if not session.turns or session.turns[0] is not turn:
+            break
+        session.turns.popleft()
+    session.summary = summary
+    conversation_histories.mark_dirty(history_key)
+
+
+def response_cache_key(messages):
+    """Hash of the chat payload with whitespace and case normalized"""
+    normalized = "\x1e".join(
+        f"{msg['role']}\x1f{' '.join(msg['content'].lower().split())}" for msg in messages
+    )
+    return hashlib.blake2b(normalized.encode(), digest_size=16).digest()
+
+
+def cached_response(messages, fresh=False):
+    """Return a cached reply for this payload, or None"""
+    if fresh or LLM_CACHE_TTL <= 0:
+        return None
+    return response_cache.get(response_cache_key(messages))
+
+
+def cache_response(messages, content, fresh=False):
+    if not fresh and LLM_CACHE_TTL > 0:
+        response_cache.set(response_cache_key(messages), content)
+
+
+async def ask_deepseek(history_key, retry_count=3, fresh=False):
     """Query DeepSeek with conversation history and retry logic"""
+    messages = build_deepseek_messages(history_key)
+    content = cached_response(messages, fresh)
+    if content is not None:
+        return {
+            "content": content,
+            "error": False
+        }
     for attempt in range(retry_count):
         try:
-            messages = [{"role": "system", "content": PERSONALITY}]
-            messages += [{"role": msg["role"], "content": msg["content"]}
-                         for msg in conversation_histories.get(history_key, [])]
-
-            response = deepseek_client.chat.completions.create(
-                model="deepseek-chat",
-                messages=messages,
-                stream=False
-            )
+            with tracer.span("llm"):
+                content = await llm.chat(messages)
+            cache_response(messages, content, fresh)
             return {
-                "content": response.choices[0].message.content.strip(),
+                "content": content,
                 "error": False
             }
         except Exception as e:
@@ -148,6 +266,78 @@ async def ask_deepseek(history_key, retry_count=3):
 
 
 
+async def stream_deepseek(message, history_key, retry_count=3, fresh=False):
+    """Stream a DeepSeek reply into one Discord message, editing it as tokens arrive"""
+    messages = build_deepseek_messages(history_key)
+    content = cached_response(messages, fresh)
+    if content is not None:
+        await message_queue.put((message, content))
+        return {
+            "content": content,
+            "error": False
+        }
+    sent = None
+    for attempt in range(retry_count):
+        content = ""
+        shown = None
+        try:
+            last_edit = 0.0
+            started = time.perf_counter()
+            async with contextlib.aclosing(llm.stream_chat(messages)) as stream:
+                async for delta in stream:
+                    content += delta
+                    now = time.monotonic()
+                    if sent is None:
+                        if not content.strip():
+                            continue  # Discord rejects a blank message
+                        shown = content[:DISCORD_MESSAGE_LIMIT]
+                        await message_queue.acquire(message.channel.id)
+                        sent = await message.reply(shown, mention_author=False)
+                        last_edit = now
+                    elif now - last_edit >= STREAM_EDIT_INTERVAL:
+                        shown = content[:DISCORD_MESSAGE_LIMIT]
+                        await sent.edit(content=shown)
+                        last_edit = now
+
+            tracer.record("llm_stream", time.perf_counter() - started)
+            content = content.strip()
+            if sent is None:
+                await message_queue.put((message, content))
+            elif content[:DISCORD_MESSAGE_LIMIT] != shown:
+                await sent.edit(content=content[:DISCORD_MESSAGE_LIMIT])
+            cache_response(messages, content, fresh)
+            return {
+                "content": content,
+                "error": False
+            }
+        except Exception as e:
+            if attempt < retry_count - 1:
+                await asyncio.sleep(2 ** attempt)  # Exponential backoff
+            else:
+                content = f"Sorry bro im tweaking, error nih: {str(e)}."
+                if sent is None:
+                    await message_queue.put((message, content))
+                else:
+                    try:
+                        await sent.edit(content=content)
+                    except Exception:
+                        await message_queue.put((message, content))
+                return {
+                    "content": content,
+                    "error": True
+                }
+
+
+async def reply_with_deepseek(message, history_key, fresh=False):
+    """Answer from the session history, streaming the reply when enabled"""
+    async with message.channel.typing():
+        if STREAM_REPLIES:
+            return await stream_deepseek(message, history_key, fresh=fresh)
+        response_data = await ask_deepseek(history_key, fresh=fresh)
+    await message_queue.put((message, response_data["content"]))
+    return response_data
+
+
 async def safe_reply(message, response):
     """Handle message replies with rate limit protection"""
     try:
@@ -161,46 +351,16 @@ async def safe_reply(message, response):
         else:
             raise
 
-async def message_processor():
-    while True:
-        message, response = await message_queue.get()
-        async with processing_lock:
-            try:
-                await message.reply(response, mention_author=False)
-            except HTTPException as e:
-                if e.status == 429:
-                    print(f"Rate limited. Retrying after {e.retry_after}s")
-                    await asyncio.sleep(e.retry_after)
-                    await message_queue.put((message, response))
-            except Exception as e:
-                print(f"Failed to send message: {str(e)}")
-            finally:
-                await asyncio.sleep(MESSAGE_COOLDOWN)
-                message_queue.task_done()
-
-
 DATABASE_URL = os.getenv("DATABASE_URL")
 
+database = Database(DATABASE_URL)
+# Database.acquire creates the pool on demand, so these recover after a failed startup connect
+conversation_histories = ConversationStore(database if DATABASE_URL else None, MAX_HISTORY, SESSION_TIMEOUT)
 
 
-async def init_db():
-    """Initialize the database connection with connection pooling"""
-    try:
-        pool = await asyncpg.create_pool(
-            DATABASE_URL,
-            min_size=1,
-            max_size=5,
-            command_timeout=60
-        )
-        # Test the connection
-        async with pool.acquire() as conn:
-            await conn.execute("SELECT 1")
-        return pool
-    except Exception as e:
-        print(f"Error connecting to the database: {e}")
-        return None
+async def ensure_db_pool(retries=6, base_delay=1):
+    return await database.ensure(retries, base_delay)
 
-db_pool = None
 
 QOTD_CHANNEL_ID = 1306689528211308575
 
@@ -208,77 +368,103 @@ intents = discord.Intents.default()
 intents.message_content = True
 intents.members = True 
 intents.presences = True 
-bot = commands.Bot(command_prefix="!", intents=intents)
+bot = commands.AutoShardedBot(command_prefix="!", intents=intents, **client_options(), **bot_options())
 scheduler = AsyncIOScheduler()
+leader = LeaderElection(os.getenv("DATABASE_URL"))
+leader_only = leader.only  # cron jobs that must fire once per cluster, not per process
+leader_task = None
+# on_ready fires again after every reconnect; these must only be started once
+ping_task = None
+flusher_task = None
+listener_task = None
+startup_lock = asyncio.Lock()  # on_ready can fire again while a slow first startup is still retrying
+prewarmer = Prewarmer(database, scheduler, lambda: leader.is_leader)
 
 coordinates = {}
 
 
+QOTD_PREFETCH = 3  # questions kept in memory for the scheduled QOTD
+QOTD_DB_TIMEOUT = 5  # seconds the scheduled QOTD waits for the database before using the buffer
+
+qotd_buffer = deque()  # (id, question) peeked from the table, not yet claimed
+qotd_unrecorded = []  # ids posted from the buffer while the database was unreachable
+
+QOTD_SCHEMA = question_bank.SCHEMA
+
+# Dequeue in one statement: lock the next row (skipping rows another caller holds),
+# delete it and log it to used_questions atomically
+DEQUEUE_QOTD = """
+WITH picked AS (
+    DELETE FROM questions
+    WHERE id = (
+        SELECT id FROM questions
+        WHERE id <> ALL($1::bigint[])
+        ORDER BY id
+        LIMIT 1
+        FOR UPDATE SKIP LOCKED
+    )
+    RETURNING id, question
+), logged AS (
+    INSERT INTO used_questions (question_id, question)
+    SELECT id, question FROM picked
+)
+SELECT id, question FROM picked
+"""
+
+# Same, for specific ids (prefetched questions); returns only rows nobody else took
+CLAIM_QOTD = """
+WITH picked AS (
+    DELETE FROM questions
+    WHERE id = ANY($1::bigint[])
+    RETURNING id, question
+), logged AS (
+    INSERT INTO used_questions (question_id, question)
+    SELECT id, question FROM picked
+)
+SELECT id, question FROM picked
+"""
+
+PEEK_QOTD = """
+SELECT id, question FROM questions
+WHERE id <> ALL($2::bigint[])
+ORDER BY id
+LIMIT $1
+"""
+
+
+database.register("qotd_dequeue", DEQUEUE_QOTD)
+database.register("qotd_claim", CLAIM_QOTD)
+database.register("qotd_peek", PEEK_QOTD)
+
+
 async def get_qotd():
     if not await ensure_db_pool():
         # return None and let caller send a fallback message or retry later
         return None
     try:
-        async with db_pool.acquire() as conn:
-            question = await conn.fetchrow("SELECT id, question FROM questions LIMIT 1")
-            if question:
-                await conn.execute("INSERT INTO used_questions (question_id) VALUES ($1)", question["id"])
-                await conn.execute("DELETE FROM questions WHERE id = $1", question["id"])
-                return question["question"]
-            return None
+        with tracer.span("get_qotd"):
+            question = await database.fetchrow("qotd_dequeue", qotd_unrecorded)
+        return question["question"] if question else None
     except Exception as e:
         print(f"get_qotd DB error: {e}")
-        # attempt reconnect once
-        await reconnect_database()
         return None
 
+coordinate_cache = CoordinateCache(database if DATABASE_URL else None, DATABASE_URL)
+
+
 async def add_coordinate(name, x, z):
     """Add a coordinate to the database."""
-    async with db_pool.acquire() as conn:
-        await conn.execute(
-            "INSERT INTO coordinates (name, x, z) VALUES ($1, $2, $3)",
-            name, x, z
-        )
+    await coordinate_cache.add(name, x, z)
 
 
 async def delete_coordinate(name):
     """Delete a coordinate from the database."""
-    async with db_pool.acquire() as conn:
-        await conn.execute("DELETE FROM coordinates WHERE name = $1", name)
+    await coordinate_cache.delete(name)
 
 
 async def list_coordinates():
-    """Retrieve all coordinates from the database."""
-    async with db_pool.acquire() as conn:
-        rows = await conn.fetch("SELECT name, x, z FROM coordinates")
-        return [{"name": row["name"], "x": row["x"], "z": row["z"]} for row in rows]
-
-# place near your db helpers
-async def ensure_db_pool(retries=6, base_delay=1):
-    global db_pool
-    for attempt in range(retries):
-        try:
-            if db_pool:
-                # quick health check
-                try:
-                    async with db_pool.acquire() as conn:
-                        await conn.execute("SELECT 1")
-                        return True
-                except Exception:
-                    # broken pool — close and reinit
-                    try:
-                        await db_pool.close()
-                    except Exception:
-                        pass
-                    db_pool = None
-
-            db_pool = await init_db()
-            if db_pool:
-                return True
-        except Exception as e:
-            print(f"DB ensure attempt {attempt+1} failed: {e}")
-        await asyncio.sleep(base_delay * (2 ** attempt))  # exponential backoff
-    return False
+    """Retrieve all coordinates, from the cache unless another instance changed them."""
+    return await coordinate_cache.rows()
 
 def load_coordinates():
     """Load coordinates from a JSON file."""
@@ -296,79 +482,87 @@ def save_coordinates():
         json.dump(coordinates, file, indent=4)
 
 
-def load_qotd():
-    """Load QOTD questions from a JSON file."""
-    if os.path.exists(QOTD_FILE):
-        with open(QOTD_FILE, "r") as file:
-            data = json.load(file)
-            return data["questions"], data["used_questions"]
-    return [], []
-
-
-def save_qotd(qotd_list, used_qotd_list):
-    """Save updated QOTD questions to a JSON file."""
-    with open(QOTD_FILE, "w") as file:
-        json.dump({"questions": qotd_list, "used_questions": used_qotd_list}, file, indent=4)
+async def prefetch_qotd():
+    """Peek the next few questions into memory so the scheduled QOTD doesn't wait on a cold database"""
+    if not await ensure_db_pool():
+        print("DB not available for QOTD prefetch")
+        return
+    try:
+        async with database.acquire() as conn:
+            if qotd_unrecorded:
+                await conn.fetch(database.statements["qotd_claim"], qotd_unrecorded)
+                qotd_unrecorded.clear()
+            rows = await conn.fetch(database.statements["qotd_peek"], QOTD_PREFETCH, qotd_unrecorded)
+    except Exception as e:
+        print(f"QOTD prefetch error: {e}")
+        return
+    qotd_buffer.clear()
+    qotd_buffer.extend((row["id"], row["question"]) for row in rows)
+    print(f"📥 Prefetched {len(qotd_buffer)} QOTD questions")
+
+
+async def claim_next_qotd():
+    """Claim the first prefetched question nobody took yet, or dequeue a fresh one"""
+    async with database.acquire() as conn:
+        while qotd_buffer:
+            question_id, question = qotd_buffer[0]
+            claimed = await conn.fetchrow(database.statements["qotd_claim"], [question_id])
+            qotd_buffer.popleft()
+            if claimed:
+                return question
+        question = await conn.fetchrow(database.statements["qotd_dequeue"], qotd_unrecorded)
+        return question["question"] if question else None
+
+
+async def next_scheduled_qotd():
+    """The question to post at QOTD time; falls back to the buffer if the database is slow"""
+    try:
+        with tracer.span("get_qotd"):
+            return await asyncio.wait_for(claim_next_qotd(), QOTD_DB_TIMEOUT)
+    except Exception as e:
+        if not qotd_buffer:
+            raise
+        print(f"QOTD DB unavailable ({e}), posting a prefetched question")
+        question_id, question = qotd_buffer.popleft()
+        qotd_unrecorded.append(question_id)
+        return question
 
 
 async def send_qotd():
     try:
-        if not await ensure_db_pool():
-            print("DB not available for QOTD")
-            return
-        question = await get_qotd()
-        channel = bot.get_channel(QOTD_CHANNEL_ID)
-        if not channel:
-            print(f"❌ Could not find channel with ID {QOTD_CHANNEL_ID}")
-            return
+        # partial: the channel's guild may live on another cluster's shards
+        channel = bot.get_partial_messageable(QOTD_CHANNEL_ID)
+        question = await next_scheduled_qotd()
         if question:
             await channel.send(f"**Kodok Kuestion of the day:** {question}")
         else:
             await channel.send("question e habis bolo, tolong suruh sorin buat refill lol")
     except Exception as e:
         print(f"Error in send_qotd: {e}")
-        await reconnect_database()
+    await prefetch_qotd()
 
-async def reconnect_database(retries=4):
-    global db_pool
-    for i in range(retries):
-        try:
-            if db_pool:
-                await db_pool.close()
-            db_pool = await init_db()
-            if db_pool:
-                print("✅ Database reconnected successfully")
-                return True
-        except Exception as e:
-            print(f"Reconnect attempt {i+1} failed: {e}")
-            await asyncio.sleep(2 ** i)
-    print("❌ Failed to reconnect to database after retries")
-    return False
-
-@scheduler.scheduled_job(CronTrigger(hour=12, minute=57, timezone="Asia/Jakarta"))  # 10 minutes before QOTD
-async def wake_database_before_qotd():
-    """Wake up the database before QOTD runs"""
-    print("🔄 Waking up database for QOTD...")
-
-    if db_pool:
-        try:
-            async with db_pool.acquire() as conn:
-                await conn.execute("SELECT 1")
-            print("✅ Database is awake and ready for QOTD")
-        except Exception as e:
-            print(f"❌ Database wake-up failed: {e}")
-            await reconnect_database()
-    else:
-        print("❌ No database connection, attempting to reconnect...")
-        await reconnect_database()
+@scheduler.scheduled_job("interval", seconds=PREWARM_TICK)
+async def prewarm_database():
+    """Wake the database ahead of jobs marked @prewarmer.ahead and keep it warm in busy hours"""
+    await prewarmer.tick()
 
 
 @scheduler.scheduled_job(CronTrigger(hour=13, minute=0, timezone="Asia/Jakarta"))
+@prewarmer.ahead
+@leader_only
 async def scheduled_qotd():
     """Scheduled QOTD task that runs after database is awake"""
     print("✅ Running QOTD with awake database...")
     await send_qotd()
 
+
+@scheduler.scheduled_job(CronTrigger(hour=12, minute=45, timezone="Asia/Jakarta"))
+@prewarmer.ahead
+@leader_only
+async def scheduled_qotd_prefetch():
+    """Refresh the QOTD buffer ahead of the 13:00 post"""
+    await prefetch_qotd()
+
 @bot.event
 async def on_error(event, *args, **kwargs):
     if event == 'on_message':
@@ -387,22 +581,24 @@ async def handle_command_error(message):
 
 
 
-@bot.event
-async def on_ready():
-    print("Bot is online.")
-    bot.loop.create_task(start_ping_server())
-
-    global db_pool, message_processor_task
-
+async def start_up():
+    """One-time startup: connect, migrate, load state, then start the scheduler"""
     # Try to initialize database with retries
     max_retries = 3
     for attempt in range(max_retries):
         try:
-            if db_pool is None:
-                db_pool = await init_db()
-
-            if db_pool:
+            if await database.ensure(retries=1, force=True):
                 print("Database connected.")
+                try:
+                    async with database.acquire() as conn:
+                        await conn.execute(QOTD_SCHEMA)
+                        await conn.execute(STALK_OPT_IN_SCHEMA)
+                except Exception as e:
+                    print(f"QOTD schema update failed: {e}")
+                await load_stalk_opt_ins()
+                await conversation_histories.restore()
+                await prefetch_qotd()
+                await coordinate_cache.refresh()
                 scheduler.start()
                 break
             else:
@@ -415,7 +611,27 @@ async def on_ready():
             else:
                 await asyncio.sleep(5)
 
-    message_processor_task = asyncio.create_task(message_processor())
+
+@bot.event
+async def on_ready():
+    global leader_task, ping_task, flusher_task, listener_task
+    print("Bot is online.")
+    if ping_task is None:
+        ping_task = bot.loop.create_task(start_ping_server())
+    for guild in bot.guilds:
+        presence_index.load(guild)
+
+    # on_ready fires again when a shard re-identifies; the scheduler only runs once startup succeeded
+    async with startup_lock:
+        if not scheduler.running:
+            await start_up()
+
+    if flusher_task is None:
+        flusher_task = bot.loop.create_task(conversation_histories.run_flusher())
+    if listener_task is None:
+        listener_task = bot.loop.create_task(coordinate_cache.run_listener())
+    if leader_task is None:
+        leader_task = bot.loop.create_task(leader.run())
     print(f"Logged in as {bot.user}")
 
 
@@ -427,7 +643,7 @@ async def clear_sessions_task():
 @bot.command(name="question")
 async def test_qotd(ctx):
     """Test the Question of the Day manually"""
-    if db_pool is None:
+    if database.pool is None:
         await ctx.send("Database not connected yet. Please try again in a moment.")
         return
 
@@ -437,6 +653,63 @@ async def test_qotd(ctx):
     else:
         await ctx.send("No more questions left in the database, bro 😭")
 
+@bot.command(name="importquestions")
+@commands.is_owner()
+async def import_questions_command(ctx):
+    """Bulk-load questions from an attached file (JSON or one per line), or questions.json"""
+    if not await ensure_db_pool():
+        await ctx.send("Database not connected yet. Please try again in a moment.")
+        return
+
+    if ctx.message.attachments:
+        data = await ctx.message.attachments[0].read()
+    else:
+        with open(question_bank.DEFAULT_FILE, "rb") as file:
+            data = file.read()
+    questions = question_bank.parse_questions(data)
+
+    async with database.acquire() as conn:
+        inserted = await question_bank.import_questions(conn, questions, question_bank.parse_used(data))
+        legacy = await question_bank.legacy_used_count(conn)
+    await ctx.send(f"🐸 Refilled {inserted} questions ({len(questions) - inserted} duplicates skipped)")
+    if legacy:
+        await ctx.send(f"⚠️ {question_bank.legacy_warning(legacy)}")
+    await prefetch_qotd()
+
+
+@bot.command(name="exportquestions")
+@commands.is_owner()
+async def export_questions_command(ctx):
+    """Send the unused question backlog as a JSON file"""
+    if not await ensure_db_pool():
+        await ctx.send("Database not connected yet. Please try again in a moment.")
+        return
+
+    async with database.acquire() as conn:
+        backlog = await question_bank.export_questions(conn)
+    data = json.dumps(backlog, indent=4, ensure_ascii=False).encode()
+    await ctx.send(
+        f"{len(backlog['questions'])} questions left",
+        file=discord.File(io.BytesIO(data), filename="questions_backlog.json")
+    )
+
+
+@bot.command(name="perf")
+@commands.is_owner()
+async def perf_command(ctx):
+    """Per-stage latency percentiles from the tracing ring buffers"""
+    summary = tracer.summary()
+    if not summary:
+        await ctx.send("belum ada data bro, tunggu ada yang ngechat dulu")
+        return
+
+    lines = [f"{'stage':<14}{'n':>7}{'p50':>9}{'p95':>9}{'p99':>9}"]
+    for stage, (count, quantiles) in summary.items():
+        p50, p95, p99 = (quantiles[q] * 1000 for q in (0.5, 0.95, 0.99))
+        lines.append(f"{stage:<14}{count:>7}{p50:>7.0f}ms{p95:>7.0f}ms{p99:>7.0f}ms")
+    await ctx.send("```\n" + "\n".join(lines) + "\n```")
+
+
 @bot.command(name="joinvc")
 async def join_vc(ctx):
     """Join or move to the user's voice channel."""
@@ -489,6 +762,7 @@ async def stop_tts(ctx):
     active_tts_user = None
 
     if ctx.voice_client:
+        tts.close_player(ctx.guild.id)
         await ctx.voice_client.disconnect()
         tts_voice_client = None
         await ctx.send("🕳️ Left the VC and stopped TTS.")
@@ -496,6 +770,25 @@ async def stop_tts(ctx):
         await ctx.send("I'm not connected to any voice channel.")
 
 
+@bot.command(name="ttsbackend")
+@commands.guild_only()
+async def tts_backend(ctx, name: str = None):
+    """Show or switch the TTS engine for this server (gtts or espeak); switching needs Manage Server"""
+    if name is None:
+        current = tts.backend_for(ctx.guild.id).name
+        await ctx.send(f"TTS engine: {current} (available: {', '.join(tts.BACKENDS)})")
+        return
+
+    if not ctx.author.guild_permissions.manage_guild and not await bot.is_owner(ctx.author):
+        await ctx.send("Cuma admin server yang boleh ganti engine TTS bro")
+        return
+
+    if not tts.set_backend(ctx.guild.id, name.lower()):
+        await ctx.send(f"Ga kenal engine '{name}' bro, pilih: {', '.join(tts.BACKENDS)}")
+        return
+    await ctx.send(f"🐸 TTS engine switched to {name.lower()}")
+
+
 @bot.command(name="testaudio")
 async def test_audio(ctx):
     """Test basic audio playback"""
@@ -507,127 +800,128 @@ async def test_audio(ctx):
     if not ctx.voice_client:
         await ctx.author.voice.channel.connect()
 
-    # Create a simple test file
-    try:
-        tts = gTTS(text="This is a test message", lang="en")
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".mp3") as temp_file:
-            temp_path = temp_file.name
-        tts.save(temp_path)
-
-        # Try minimal playback
-        ctx.voice_client.play(
-            discord.FFmpegPCMAudio(temp_path),
-            after=lambda e: asyncio.create_task(cleanup_tts_file(temp_path, e))
-        )
+    tts.get_player(ctx.voice_client).say("This is a test message", lang="en")
+    await ctx.send("Playing test audio...")
 
-        await ctx.send("Playing test audio...")
-
-    except Exception as e:
-        await ctx.send(f"Error: {e}")
-        if 'temp_path' in locals():
-            try:
-                os.remove(temp_path)
-            except:
-                pass
 # Add this function to get a random user with an activity
-async def get_random_user_with_activity(guild):
-    """Get a random user who has a current activity (game, music, etc)"""
-    users_with_activities = []
-
-    print(f"🔍 Scanning {len(guild.members)} members in guild: {guild.name}")
+presence_index = PresenceIndex()
+presence_sampler = PresenceSampler()
+
+STALK_OPT_IN_SCHEMA = """
+CREATE TABLE IF NOT EXISTS stalk_opt_in (
+    guild_id BIGINT NOT NULL,
+    user_id BIGINT NOT NULL,
+    PRIMARY KEY (guild_id, user_id)
+)
+"""
+database.register("stalk_opt_ins", "SELECT guild_id, user_id FROM stalk_opt_in")
+database.register("stalk_opt_in", "INSERT INTO stalk_opt_in (guild_id, user_id) VALUES ($1, $2) ON CONFLICT DO NOTHING")
+database.register("stalk_opt_out", "DELETE FROM stalk_opt_in WHERE guild_id = $1 AND user_id = $2")
 
-    for member in guild.members:
-        # Skip bots and offline users
-        if member.bot:
-            continue
 
-        if member.status == discord.Status.offline:
-            continue
+async def load_stalk_opt_ins():
+    try:
+        rows = await database.fetch("stalk_opt_ins")
+    except Exception as e:
+        print(f"Loading stalk opt-ins failed: {e}")
+        return
+    for row in rows:
+        presence_sampler.opt_in(row["guild_id"], row["user_id"])
 
-        # Check if user has any activities
-        if member.activities:
-            valid_activity_found = False
 
-            for activity in member.activities:
-                # Filter out custom statuses and focus on meaningful activities
-                if (isinstance(activity, discord.Spotify) or
-                        isinstance(activity, discord.Game) or
-                        isinstance(activity, discord.Streaming) or
-                        (hasattr(activity, 'type') and
-                         activity.type in [discord.ActivityType.playing,
-                                           discord.ActivityType.listening,
-                                           discord.ActivityType.streaming,
-                                           discord.ActivityType.watching])):
+async def get_random_user_with_activity(guild, kind=None):
+    """Get a random user who has a current activity (game, music, etc)"""
+    if LOW_MEMORY_MODE:
+        # no member cache: ask Discord about opted-in and recently active members only
+        chosen_user = await presence_sampler.random_member(guild, kind)
+    else:
+        chosen_user = presence_index.random_member(guild, kind)
+    if chosen_user:
+        print(f"🎯 Selected user: {chosen_user.display_name} in {guild.name}")
+        return chosen_user
 
-                    # Additional filtering for custom statuses
-                    if (isinstance(activity, discord.CustomActivity) or
-                            (hasattr(activity, 'type') and activity.type == discord.ActivityType.custom)):
-                        continue  # Skip custom statuses
+    print("❌ No users with valid activities found")
+    return None
 
-                    valid_activity_found = True
-                    break
 
-            if valid_activity_found:
-                users_with_activities.append(member)
+async def get_random_users_with_activity(guild, count):
+    """Up to count distinct users with a current activity, for prepared commentary"""
+    if LOW_MEMORY_MODE:
+        return await presence_sampler.random_members(guild, count)
+    return presence_index.random_members(guild, count)
 
-    print(f"📊 Found {len(users_with_activities)} users with valid activities")
 
-    if users_with_activities:
-        chosen_user = random.choice(users_with_activities)
-        print(f"🎯 Selected user: {chosen_user.display_name}")
-        return chosen_user
+async def current_members(guild, member_ids):
+    """member id -> member with an up-to-date presence"""
+    if LOW_MEMORY_MODE:
+        return {member.id: member for member in await presence_sampler.fetch(guild, member_ids)}
+    members = (guild.get_member(member_id) for member_id in member_ids)
+    return {member.id: member for member in members if member is not None}
 
-    print("❌ No users with valid activities found")
-    return None
 
 # Add this function to describe the activity
 def describe_activity(member):
     """Generate a description of the user's activities, excluding custom statuses"""
-    if not member.activities:
-        return f"{member.display_name} is doing nothing interesting"
-
-    activities_info = []
-    for activity in member.activities:
-        # Skip custom statuses
-        if (isinstance(activity, discord.CustomActivity) or
-                (hasattr(activity, 'type') and activity.type == discord.ActivityType.custom)):
-            continue
-
-        if isinstance(activity, discord.Spotify):
-            activities_info.append(f"listening to {activity.title} by {activity.artist}")
-        elif isinstance(activity, discord.Game):
-            activities_info.append(f"playing {activity.name}")
-        elif isinstance(activity, discord.Streaming):
-            activities_info.append(f"streaming {activity.name} on {activity.platform}")
-        elif activity.type == discord.ActivityType.watching:
-            activities_info.append(f"watching {activity.name}")
-        elif activity.type == discord.ActivityType.listening:
-            activities_info.append(f"listening to {activity.name}")
-        elif activity.type == discord.ActivityType.playing:
-            activities_info.append(f"playing {activity.name}")
-        # Skip any other activities that might be custom statuses
-
+    activities_info = [description for _, description in member_activities(member)]
     if not activities_info:
         return f"{member.display_name} is doing nothing interesting"
 
     return f"{member.display_name} is {', and '.join(activities_info)}"
 
+
+@bot.command(name="stalkme")
+async def stalk_me_command(ctx):
+    """Always be a stalk candidate, even in low-memory mode"""
+    presence_sampler.opt_in(ctx.guild.id, ctx.author.id)
+    try:
+        await database.execute("stalk_opt_in", ctx.guild.id, ctx.author.id)
+    except Exception as e:
+        print(f"Saving stalk opt-in failed: {e}")
+    await ctx.send("oke, siap2 di stalk 👀")
+
+
+@bot.command(name="unstalkme")
+async def unstalk_me_command(ctx):
+    """Drop out of the opted-in stalk candidates"""
+    presence_sampler.opt_out(ctx.guild.id, ctx.author.id)
+    try:
+        await database.execute("stalk_opt_out", ctx.guild.id, ctx.author.id)
+    except Exception as e:
+        print(f"Saving stalk opt-out failed: {e}")
+    await ctx.send("yaudah, ga di stalk lagi (kecuali lagi rame chat ya)")
+
+
+@bot.event
+async def on_presence_update(before, after):
+    presence_index.update(after)
+
+
+@bot.event
+async def on_member_remove(member):
+    presence_index.remove(member.guild.id, member.id)
+
+
+@bot.event
+async def on_guild_join(guild):
+    presence_index.load(guild)
+
+
+@bot.event
+async def on_guild_remove(guild):
+    presence_index.drop(guild.id)
+
 # Add this function to generate commentary
 async def generate_activity_commentary(activity_description, user):
     """Generate witty commentary about the user's activity"""
     prompt = f"A user is {activity_description}. Generate a short, witty, sarcastic commentary about this in Indonesian mixed with English. Keep it under 2 sentences and make it funny."
 
     try:
-        response = deepseek_client.chat.completions.create(
-            model="deepseek-chat",
-            messages=[
-                {"role": "system", "content": PERSONALITY},
-                {"role": "user", "content": prompt}
-            ],
-            stream=False
-        )
+        content = await llm.chat([
+            {"role": "system", "content": PERSONALITY},
+            {"role": "user", "content": prompt}
+        ])
         # Add user mention to the response
-        return f"{user.mention} {response.choices[0].message.content.strip()}"
+        return f"{user.mention} {content}"
     except Exception as e:
         return f"{user.mention} Waduh, liat nih orang {activity_description}... interesting choice! 🐸"
 
@@ -635,28 +929,107 @@ async def generate_activity_commentary(activity_description, user):
 
 TARGET_CHANNEL_ID = 1333665831200100353
 
+commentary_buffer = CommentaryBuffer()
 
-@scheduler.scheduled_job(CronTrigger(hour='*/2', minute=0, timezone="Asia/Jakarta"))
-async def random_activity_commentary():
+
+async def prepare_activity_commentary(slot, retry_count=3):
+    """Sample candidates and generate their commentary in one batch, ahead of a slot"""
+    if not bot.guilds:
+        return
+    guild = random.choice(bot.guilds)
     try:
-        if not bot.guilds:
-            return
+        members = await get_random_users_with_activity(guild, COMMENTARY_CANDIDATES)
+    except Exception as e:
+        print(f"Sampling commentary candidates failed: {e}")
+        return
+    if not members:
+        print(f"❌ No users with activities to prepare {slot} commentary for")
+        return
 
-        guild = random.choice(bot.guilds)
-        user = await get_random_user_with_activity(guild)
+    descriptions = [describe_activity(member) for member in members]
+    for attempt in range(retry_count):
+        try:
+            with tracer.span("llm_batch"):
+                texts = await generate_batch(PERSONALITY, descriptions)
+            break
+        except Exception as e:
+            if attempt == retry_count - 1:
+                print(f"Preparing {slot} commentary failed: {e}")
+                return
+            await asyncio.sleep(2 ** attempt)
 
-        if not user:
-            return
+    entries = [
+        (member.id, description, text)
+        for member, description, text in zip(members, descriptions, texts) if text
+    ]
+    commentary_buffer.put(slot, guild.id, entries)
+    print(f"📝 Prepared {len(entries)}/{len(members)} {slot} commentaries in {guild.name}")
 
-        activity_description = describe_activity(user)
-        # Pass the user to the commentary function
-        commentary = await generate_activity_commentary(activity_description, user)
+
+async def prepared_activity_commentary(slot):
+    """A prepared commentary for someone still doing what it's about, or None"""
+    prepared = commentary_buffer.take(slot)
+    if prepared is None:
+        return None
+    guild_id, entries = prepared
+    guild = bot.get_guild(guild_id)
+    if guild is None:
+        return None
+    try:
+        members = await current_members(guild, [member_id for member_id, _, _ in entries])
+    except Exception as e:
+        print(f"Re-checking prepared commentary failed: {e}")
+        return None
+    for member_id, description, text in entries:
+        member = members.get(member_id)
+        if member is not None and describe_activity(member) == description:
+            commentary_buffer.used += 1
+            print(f"🎯 Using prepared commentary for {member.display_name}")
+            return f"{member.mention} {text}"
+    commentary_buffer.stale += 1
+    print(f"⌛ Nobody is still doing their prepared {slot} activity")
+    return None
+
+
+async def live_activity_commentary():
+    """Pick a user now and wait on the LLM for their commentary, the old way"""
+    if not bot.guilds:
+        return None
+    guild = random.choice(bot.guilds)
+    print(f"🎯 Selected guild: {guild.name}")
+    user = await get_random_user_with_activity(guild)
+    if not user:
+        return None
+
+    # Debug: Show what activities the user has
+    print(f"📋 Activities for {user.display_name}:")
+    for i, activity in enumerate(user.activities):
+        print(f"  {i + 1}. {activity.name} (type: {type(activity).__name__})")
+
+    activity_description = describe_activity(user)
+    print(f"📝 Generated description: {activity_description}")
+    return await generate_activity_commentary(activity_description, user)
+
+
+# prepare jobs fire COMMENTARY_LEAD minutes before the hour of their slot
+@scheduler.scheduled_job(CronTrigger(hour='1-23/2', minute=60 - COMMENTARY_LEAD, timezone="Asia/Jakarta"))
+@leader_only
+async def prepare_random_activity_commentary():
+    await prepare_activity_commentary("activity")
+
+
+@scheduler.scheduled_job(CronTrigger(hour='*/2', minute=0, timezone="Asia/Jakarta"))
+@leader_only
+async def random_activity_commentary():
+    try:
+        commentary = await prepared_activity_commentary("activity") or await live_activity_commentary()
+        if not commentary:
+            return
 
         # Send to specific channel
-        target_channel = bot.get_channel(TARGET_CHANNEL_ID)
-        if target_channel:
-            await target_channel.send(commentary)
-            print(f"✅ Activity commentary sent for {user.display_name}")
+        target_channel = bot.get_partial_messageable(TARGET_CHANNEL_ID)
+        await target_channel.send(commentary)
+        print("✅ Activity commentary sent")
 
     except Exception as e:
         print(f"Error in activity commentary: {e}")
@@ -691,47 +1064,27 @@ async def stalk_command(ctx):
         import traceback
         traceback.print_exc()
 
-# Update the daily_stalk function to pass the user to generate_activity_commentary
+@scheduler.scheduled_job(CronTrigger(hour=18, minute=60 - COMMENTARY_LEAD, timezone="Asia/Jakarta"))
+@leader_only
+async def prepare_daily_stalk():
+    await prepare_activity_commentary("daily")
+
+
 @scheduler.scheduled_job(CronTrigger(hour=19, minute=0, timezone="Asia/Jakarta"))  # 7 PM Jakarta time
+@leader_only
 async def daily_stalk():
     """Randomly stalk one person every day at 7 PM"""
     try:
         print("🕔 7 PM - Time for daily stalk!")
 
-        # Get a random guild (server) the bot is in
-        if not bot.guilds:
-            print("❌ No guilds available")
-            return
-
-        guild = random.choice(bot.guilds)
-        print(f"🎯 Selected guild: {guild.name}")
-
-        user = await get_random_user_with_activity(guild)
-
-        if not user:
+        commentary = await prepared_activity_commentary("daily") or await live_activity_commentary()
+        if not commentary:
             print("❌ No users with activities found for daily stalk")
             return
 
-        # Debug: Show what activities the user has
-        print(f"📋 Activities for {user.display_name}:")
-        for i, activity in enumerate(user.activities):
-            print(f"  {i + 1}. {activity.name} (type: {type(activity).__name__})")
-
-        activity_description = describe_activity(user)
-        print(f"📝 Generated description: {activity_description}")
-
-        # Pass the user to the commentary function
-        commentary = await generate_activity_commentary(activity_description, user)
-
-        # Send to a specific channel or random channel
-        TARGET_CHANNEL_ID = 1333665831200100353  # Replace with your desired channel ID
-        target_channel = bot.get_channel(TARGET_CHANNEL_ID)
-
-        if target_channel:
-            await target_channel.send(commentary)
-            print(f"✅ Daily stalk completed for {user.display_name}")
-        else:
-            print(f"❌ Could not find target channel {TARGET_CHANNEL_ID}")
+        target_channel = bot.get_partial_messageable(TARGET_CHANNEL_ID)
+        await target_channel.send(commentary)
+        print("✅ Daily stalk completed")
 
     except Exception as e:
         print(f"❌ Daily stalk error: {e}")
@@ -739,20 +1092,6 @@ async def daily_stalk():
         traceback.print_exc()
 
 
-async def cleanup_tts_file(file_path, error=None):
-    """Clean up temporary TTS files after playback"""
-    if error:
-        print(f"TTS playback error: {error}")
-
-    # Wait a bit then clean up
-    await asyncio.sleep(1)
-
-    try:
-        if os.path.exists(file_path):
-            os.remove(file_path)
-            print(f"Cleaned up TTS file: {file_path}")
-    except Exception as e:
-        print(f"Error cleaning up TTS file: {e}")
 @scheduler.scheduled_job("interval", minutes=1)
 async def tts_inactivity_check():
     global last_tts_activity, tts_voice_client, active_tts_user
@@ -760,6 +1099,7 @@ async def tts_inactivity_check():
     if tts_voice_client and active_tts_user:
         if time.time() - last_tts_activity > 15 * 60:  # 15 minutes
             try:
+                tts.close_player(tts_voice_client.guild.id)
                 await tts_voice_client.disconnect()
                 print("🕒 Auto-disconnected from VC due to inactivity.")
             except Exception as e:
@@ -768,260 +1108,266 @@ async def tts_inactivity_check():
                 tts_voice_client = None
                 active_tts_user = None
 
-@bot.event
-async def on_message(message):
-    global active_tts_user, last_tts_activity, tts_voice_client
-    if message.author == bot.user:
-        return
+message_router = Router()
 
-        # 🔥 ADD THIS: Skip command processing in the custom message handler
-    if message.content.startswith(bot.command_prefix):
-        await bot.process_commands(message)
-        return
-        # 🔊 TTS functionality
-    if (active_tts_user == message.author.id and
-            message.channel.name == "vc-chat" and
-            tts_voice_client and
-            tts_voice_client.is_connected() and
-            not tts_voice_client.is_playing()):
 
-        last_tts_activity = time.time()
+async def in_session(message, text):
+    """Trigger check: the author has a live conversation in this channel"""
+    return await conversation_histories.load(await get_history_key(message)) is not None
 
-        try:
-            print(f"Generating TTS audio for: {message.content}")
 
-            # Generate TTS
-            tts = gTTS(text=message.content, lang="id")
+@message_router.regex("shut_up", r"okay shut up kodok\Z")
+async def handle_shut_up(message, match):
+    history_key = await get_history_key(message)
+    if history_key in conversation_histories:
+        del conversation_histories[history_key]
+        await message_queue.put((message, "okay man damn :cold_sweat:"))
+    else:
+        await message_queue.put((message, "bro i wasn't even talking??? :sob: "))
 
-            # Create temporary file
-            with tempfile.NamedTemporaryFile(delete=False, suffix=".mp3") as temp_file:
-                temp_path = temp_file.name
 
-            tts.save(temp_path)
-            print(f"TTS saved to: {temp_path}")
+@message_router.regex("woi_kodok", r"woi kodok")
+async def handle_woi_kodok(message, match):
+    history_key = await get_history_key(message)
+    prompt = message.content[len("woi kodok"):].strip()
 
-            # MINIMAL approach - no FFmpeg options
-            audio_source = discord.FFmpegPCMAudio(temp_path)
+    if not prompt:
+        await message_queue.put((message, f"what kenapa manggil manggil ak tau aku ganteng {BOT_NAME}? 🐸"))
+        return
 
-            # Play audio
-            tts_voice_client.play(
-                audio_source,
-                after=lambda e: asyncio.create_task(cleanup_tts_file(temp_path, e))
-            )
+    async with tracer.waited(conversation_histories.lock(history_key), "history_lock"):  
+       
+        await add_to_history(history_key, "user", prompt)
 
-            print("TTS playback started successfully!")
+        response_data = await reply_with_deepseek(message, history_key)
+        response = response_data["content"]
 
-        except Exception as e:
-            print(f"Error in TTS processing: {e}")
-            if 'temp_path' in locals() and os.path.exists(temp_path):
-                try:
-                    os.remove(temp_path)
-                except:
-                    pass
-    history_key = await get_history_key(message)
+      
+        await add_to_history(history_key, "assistant", response)
 
-  
-    if message.content.lower() == "okay shut up kodok":
-        if history_key in conversation_histories:
+       
+        if response_data["error"]:
             del conversation_histories[history_key]
-            await message_queue.put((message, "okay man damn :cold_sweat:"))
         else:
-            await message_queue.put((message, "bro i wasn't even talking??? :sob: "))
-        return
+            asyncio.create_task(fold_history(history_key))
 
-  
-    if message.content.lower().startswith("woi kodok"):
-        prompt = message.content[len("woi kodok"):].strip()
 
-        if not prompt:
-            await message_queue.put((message, f"what kenapa manggil manggil ak tau aku ganteng {BOT_NAME}? 🐸"))
+@message_router.when("conversation", in_session)
+async def handle_conversation(message, match):
+    history_key = await get_history_key(message)
+    async with tracer.waited(conversation_histories.lock(history_key), "history_lock"): 
+        
+        session = conversation_histories.get(history_key)
+        if session is None:
+            return
+        if conversation_histories.is_expired(session):
+            del conversation_histories[history_key]
             return
 
-        async with locks[history_key]:  
-           
-            await add_to_history(history_key, "user", prompt)
+       
+        await add_to_history(history_key, "user", message.content)
 
-            async with message.channel.typing():
-                response_data = await ask_deepseek(history_key)
-                response = response_data["content"]
+        response_data = await reply_with_deepseek(message, history_key)
+        response = response_data["content"]
 
-          
-            await add_to_history(history_key, "assistant", response)
+       
+        await add_to_history(history_key, "assistant", response)
 
-           
-            if response_data["error"]:
-                del conversation_histories[history_key]
+        if response_data["error"]:
+            del conversation_histories[history_key]
+        else:
+            asyncio.create_task(fold_history(history_key))
 
-            endings = ["🐸"]
-            await message_queue.put ((message, response))
-        return  
 
-   
-    if history_key in conversation_histories:
-        async with locks[history_key]: 
-            
-            last_timestamp = datetime.fromisoformat(conversation_histories[history_key][-1]['timestamp'])
-            if (datetime.now() - last_timestamp).total_seconds() > SESSION_TIMEOUT:
-                del conversation_histories[history_key]
-                return
+@message_router.regex("add_coordinate", r"add (\w+) (-?\d+) (-?\d+) dong")
+async def handle_add_coordinate(message, match):
+    name, x, z = match.groups()
+    x, z = int(x), int(z)
+    await add_coordinate(name, x, z)
+    await message_queue.put((message, f"ok kontol Coordinate '{name}' added: X={x}, Z={z}"))
 
-           
-            await add_to_history(history_key, "user", message.content)
 
-            async with message.channel.typing():
-                response_data = await ask_deepseek(history_key)
-                response = response_data["content"]
+@message_router.regex("delete_coordinate", r"delete (\w+) pls")
+async def handle_delete_coordinate(message, match):
+    name = match.group(1)
+    await delete_coordinate(name)
+    await message_queue.put((message, f"Coordinate '{name}' deleted. jahat nye.."))
 
-           
-            await add_to_history(history_key, "assistant", response)
 
-            if response_data["error"]:
-                del conversation_histories[history_key]
+@message_router.regex("list_coordinates", r"coords po o")
+async def handle_list_coordinates(message, match):
+    coord_list = await coordinate_cache.listing()
+    if not coordinate_cache.loaded:
+        await message_queue.put((message, "database e lagi turu bro, coba lagi bentar"))
+    elif not coord_list:
+        await message_queue.put((message, "masih ga ada coords bro??"))
+    else:
+        await message_queue.put((message, f"nyoh:\n{coord_list}"))
 
-            endings = [" 🐸"]
-            await message_queue.put((message, response))
-        return  
 
-   
-    add_pattern = r"add (\w+) (-?\d+) (-?\d+) dong"
-    add_match = re.match(add_pattern, message.content.lower())
-    if add_match:
-        name, x, z = add_match.groups()
-        x, z = int(x), int(z)
-        await add_coordinate(name, x, z)
-        await message_queue.put((message, f"ok kontol Coordinate '{name}' added: X={x}, Z={z}"))
+@message_router.regex("nearest_coordinate", r"nearest to (-?\d+) (-?\d+)")
+async def handle_nearest_coordinate(message, match):
+    x, z = int(match.group(1)), int(match.group(2))
+    if not await coordinate_cache.ensure_loaded():
+        await message_queue.put((message, "database e lagi turu bro, coba lagi bentar"))
         return
-   
-    delete_pattern = r"delete (\w+) pls"
-    delete_match = re.match(delete_pattern, message.content.lower())
-    if delete_match:
-        name = delete_match.group(1)
-        await delete_coordinate(name)
-        await message_queue.put((message, f"Coordinate '{name}' deleted. jahat nye.."))
+    nearest = coordinate_cache.index.nearest(x, z, k=3)
+    if not nearest:
+        await message_queue.put((message, "masih ga ada coords bro??"))
         return
+    lines = "\n".join(f"{name}: X={px}, Z={pz} ({distance:.0f} blocks)" for distance, name, px, pz in nearest)
+    await message_queue.put((message, f"paling deket dari X={x}, Z={z}:\n{lines}"))
 
-  
-    list_pattern = r"coords po o"
-    list_match = re.match(list_pattern, message.content.lower())
-    if list_match:
-        coords = await list_coordinates()
-        if not coords:
-            await message_queue.put((message, "masih ga ada coords bro??"))
-        else:
-            coord_list = "\n\n".join([f"{c['name']}: X={c['x']}, Z={c['z']}" for c in coords])
-            await message_queue.put((message, f"nyoh:\n{coord_list}"))
-        return
 
-    
-    rps_pattern = r"i pick (rock|paper|scissors)"
-    rps_match = re.match(rps_pattern, message.content.lower())
-    if rps_match:
-        user_choice = rps_match.group(1)
-        bot_choice = random.choice(["rock", "paper", "scissors"])
-
-        result = ""
-        if user_choice == bot_choice:
-            result = f"wah asu bangsat We both picked {user_choice}. (tie)"
-        elif (user_choice == "rock" and bot_choice == "scissors") or (
-                user_choice == "paper" and bot_choice == "rock") or (
-                user_choice == "scissors" and bot_choice == "paper"):
-            result = f"fuck u asshole kamu pasti curang literally how did You pick {user_choice}, while i picked {bot_choice}. fuck u (Win)"
-        else:
-            result = f"LOSERRRRRRRRRRRRRRRRR I picked {bot_choice}, and you picked {user_choice}. (lose)"
-
-        await message_queue.put((message, result))
+@message_router.regex("coordinates_within", r"within (\d+) blocks of (-?\d+) (-?\d+)")
+async def handle_coordinates_within(message, match):
+    radius, x, z = (int(value) for value in match.groups())
+    if not await coordinate_cache.ensure_loaded():
+        await message_queue.put((message, "database e lagi turu bro, coba lagi bentar"))
         return
-
-    compatibility_pattern = r"affakah saya cocok dengan (.+)"
-    compatibility_match = re.match(compatibility_pattern, message.content.lower())
-    if compatibility_match:
-        name = compatibility_match.group(1)
-        responses = [
-            ":grimacing:",
-            f"wait you??? with {name}????",
-            "woah uh sure it could work maybe probably....",
-            f"yikes kamu dapet ide dari mana mau sama sih {name} bro",
-            f"yakin kah?? aku denger {name} kemarin jualan fent di rumah nya luna",
-            "sure!!!! like peanut butter and jelly :yum:",
-            f"wait u and {name} weren't dating already?",
-            f"hohohhohoho you and {name} hol up bro let me get some popcorn first",
-            f"welahdalah wes nggak nggak nggak",
-            "LMAOOOOOOOOOOOOOOOOOOOOOOOOOOO",
-            f"pfft you and {name}? oh wait fr? wowzers.",
-            f"i mean... go off, i guess?? {name} tho??",
-            "full of drama but okay sure man",
-            "wow sounds like a fanfic waiting to happen.",
-            f"oh sure, and next you're gonna tell me the sky is green. {name}? lol",
-            f"bold of you to assume {name} feels the same way.",
-            "hmmmmmm lemme think....................naaaaah.",
-            "big moves big moves, but like, sure.",
-            "idk bro, it’s giving ‘friends only’ vibes.",
-            f"jadi begini, {name} lagi sibuk main minecraft ama aku tadi sih.",
-            "100% compatibility! oh wait, salah baca... itu 10%.",
-        ]
-        response = random.choice(responses)
-        await message_queue.put((message, response))
+    hits = coordinate_cache.index.within(x, z, radius)
+    if not hits:
+        await message_queue.put((message, f"ga ada apa apa dalam {radius} blocks, sepi bro"))
         return
+    lines = "\n".join(f"{name}: X={px}, Z={pz} ({distance:.0f} blocks)" for distance, name, px, pz in hits[:25])
+    more = f"\n...and {len(hits) - 25} more" if len(hits) > 25 else ""
+    await message_queue.put((message, f"nyoh, dalam {radius} blocks dari X={x}, Z={z}:\n{lines}{more}"))
+
+
+@message_router.regex("rock_paper_scissors", r"i pick (rock|paper|scissors)")
+async def handle_rock_paper_scissors(message, match):
+    user_choice = match.group(1)
+    bot_choice = random.choice(["rock", "paper", "scissors"])
+
+    result = ""
+    if user_choice == bot_choice:
+        result = f"wah asu bangsat We both picked {user_choice}. (tie)"
+    elif (user_choice == "rock" and bot_choice == "scissors") or (
+            user_choice == "paper" and bot_choice == "rock") or (
+            user_choice == "scissors" and bot_choice == "paper"):
+        result = f"fuck u asshole kamu pasti curang literally how did You pick {user_choice}, while i picked {bot_choice}. fuck u (Win)"
+    else:
+        result = f"LOSERRRRRRRRRRRRRRRRR I picked {bot_choice}, and you picked {user_choice}. (lose)"
+
+    await message_queue.put((message, result))
+
+
+@message_router.regex("compatibility", r"affakah saya cocok dengan (.+)")
+async def handle_compatibility(message, match):
+    name = match.group(1)
+    responses = [
+        ":grimacing:",
+        f"wait you??? with {name}????",
+        "woah uh sure it could work maybe probably....",
+        f"yikes kamu dapet ide dari mana mau sama sih {name} bro",
+        f"yakin kah?? aku denger {name} kemarin jualan fent di rumah nya luna",
+        "sure!!!! like peanut butter and jelly :yum:",
+        f"wait u and {name} weren't dating already?",
+        f"hohohhohoho you and {name} hol up bro let me get some popcorn first",
+        f"welahdalah wes nggak nggak nggak",
+        "LMAOOOOOOOOOOOOOOOOOOOOOOOOOOO",
+        f"pfft you and {name}? oh wait fr? wowzers.",
+        f"i mean... go off, i guess?? {name} tho??",
+        "full of drama but okay sure man",
+        "wow sounds like a fanfic waiting to happen.",
+        f"oh sure, and next you're gonna tell me the sky is green. {name}? lol",
+        f"bold of you to assume {name} feels the same way.",
+        "hmmmmmm lemme think....................naaaaah.",
+        "big moves big moves, but like, sure.",
+        "idk bro, it’s giving ‘friends only’ vibes.",
+        f"jadi begini, {name} lagi sibuk main minecraft ama aku tadi sih.",
+        "100% compatibility! oh wait, salah baca... itu 10%.",
+    ]
+    response = random.choice(responses)
+    await message_queue.put((message, response))
+
+
+@message_router.regex("what_do_you_think", r"what do you think of (.+) and (.+)")
+async def handle_what_do_you_think(message, match):
+    person_a, person_b = match.groups()
+    responses = [
+        f"{person_a} and {person_b}????????? {person_a.upper()} AND {person_b.upper()}????????????????????? :cold_sweat:",
+        ":sob: :sob: :sob:",
+        f"damn bro i mean i heard {person_b} is a saint but with...{person_a}? hmmm....",
+        f"well i don't think oil and water can mix well. wait, oh you mean {person_a} and {person_b}?? same thing lah.",
+        f"Yes???? obvi???? are u crazy {person_a} and {person_b} basically inseparable are u insane.",
+        f"bukane mereka berdua barusan nikahan kemarin? oh blum? huh...",
+        f"bro.....i saw {person_a} playing love and deepspace behind {person_b}'s back....",
+        f"cocok jir maksude apa kamu tanya kek gitu seng gena.",
+        "hoho itu panas banget, sure bro.",
+        f"{person_a} and {person_b}? honestly, feels like when you accidentally add too much chili sauce—chaotic but oddly satisfying.",
+        f"aku denger mereka barusan duet karaoke lagu sedih, trus {person_a} nangis di pundaknya {person_b}...",
+    ]
+    response = random.choice(responses)
+    await message_queue.put((message, response))
+
+
+special_names = []
+
+
+@message_router.when("special_names", lambda message, text: any(name in text for name in special_names))
+async def handle_special_names(message, match):
+    await message_queue.put((message, "yayayayaya saya setuju"))
+
+
+@message_router.when("metal_kodok", lambda message, text: "metal kodok" in text)
+async def handle_metal_kodok(message, match):
+    responses = [
+        "halo",
+        "yes babe?",
+        "sapa manggil woi",
+        "berisik ae",
+        "^^",
+        "lek suka bilang aja twin lolol",
+        "yoi",
+        "huha",
+        "greetings",
+        "yo",
+        "whats good",
+        "u suck balls",
+        "im trying to sleep here man",
+        "i was playing Mobile Legends: Bang Bang (use code MetalKodok25 to get 25 gems",
+        "oh hi kamu kok ganteng hari ini damn",
+        "oh hi kamu kok jelek hari ini",
+        "fuck you",
+        "lho ya ndamau",
+        "ak setuju banget",
+        "hih",
+        "ngeri",
+        "gk lucu",
+        "kamu mirip logan paul",
+        "suruh sorin aja",
+        "sek ta lah",
+    ]
+    response = random.choice(responses)
+    await message_queue.put((message, response))
 
-    think_pattern = r"what do you think of (.+) and (.+)"
-    think_match = re.match(think_pattern, message.content.lower())
-    if think_match:
-        person_a, person_b = think_match.groups()
-        responses = [
-            f"{person_a} and {person_b}????????? {person_a.upper()} AND {person_b.upper()}????????????????????? :cold_sweat:",
-            ":sob: :sob: :sob:",
-            f"damn bro i mean i heard {person_b} is a saint but with...{person_a}? hmmm....",
-            f"well i don't think oil and water can mix well. wait, oh you mean {person_a} and {person_b}?? same thing lah.",
-            f"Yes???? obvi???? are u crazy {person_a} and {person_b} basically inseparable are u insane.",
-            f"bukane mereka berdua barusan nikahan kemarin? oh blum? huh...",
-            f"bro.....i saw {person_a} playing love and deepspace behind {person_b}'s back....",
-            f"cocok jir maksude apa kamu tanya kek gitu seng gena.",
-            "hoho itu panas banget, sure bro.",
-            f"{person_a} and {person_b}? honestly, feels like when you accidentally add too much chili sauce—chaotic but oddly satisfying.",
-            f"aku denger mereka barusan duet karaoke lagu sedih, trus {person_a} nangis di pundaknya {person_b}...",
-        ]
-        response = random.choice(responses)
-        await message_queue.put((message, response))
-        return
 
-    special_names = []
-    if any(name in message.content.lower() for name in special_names):
-        await message_queue.put((message, "yayayayaya saya setuju"))
+@bot.event
+async def on_message(message):
+    global active_tts_user, last_tts_activity, tts_voice_client
+    if message.author == bot.user:
         return
+    prewarmer.observe()
+    if LOW_MEMORY_MODE and message.guild:
+        presence_sampler.seen(message.author)
 
-    if "metal kodok" in message.content.lower():
-        responses = [
-            "halo",
-            "yes babe?",
-            "sapa manggil woi",
-            "berisik ae",
-            "^^",
-            "lek suka bilang aja twin lolol",
-            "yoi",
-            "huha",
-            "greetings",
-            "yo",
-            "whats good",
-            "u suck balls",
-            "im trying to sleep here man",
-            "i was playing Mobile Legends: Bang Bang (use code MetalKodok25 to get 25 gems",
-            "oh hi kamu kok ganteng hari ini damn",
-            "oh hi kamu kok jelek hari ini",
-            "fuck you",
-            "lho ya ndamau",
-            "ak setuju banget",
-            "hih",
-            "ngeri",
-            "gk lucu",
-            "kamu mirip logan paul",
-            "suruh sorin aja",
-            "sek ta lah",
-        ]
-        response = random.choice(responses)
-        await message_queue.put((message, response))
-        return
+    async with tracer.trace("on_message"):
+        # 🔥 ADD THIS: Skip command processing in the custom message handler
+        if message.content.startswith(bot.command_prefix):
+            await bot.process_commands(message)
+            return
+            # 🔊 TTS functionality
+        if (active_tts_user == message.author.id and
+                message.channel.name == "vc-chat" and
+                tts_voice_client and
+                tts_voice_client.is_connected()):
 
-    await bot.process_commands(message)
+            last_tts_activity = time.time()
+            tts.get_player(tts_voice_client).say(message.content)
+        if await message_router.dispatch(message) is None:
+            await bot.process_commands(message)
 
 
-bot.run(os.getenv("DISCORD_TOKEN"))
+if __name__ == "__main__":
+    bot.run(os.getenv("DISCORD_TOKEN"))
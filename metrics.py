@@ -0,0 +1,116 @@
+"""Prometheus text-format metrics for the /metrics route on the ping server."""
+import bisect
+import time
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# seconds; LLM calls and TTS renders both live somewhere between 50ms and 30s
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8, 15, 30, 60)
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    body = ",".join(f'{key}="{str(value)}"' for key, value in sorted(labels.items()))
+    return "{" + body + "}"
+
+
+def _merge(labels, **extra):
+    merged = dict(labels)
+    merged.update(extra)
+    return merged
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+class Histogram:
+    """Cumulative latency histogram, one series per label set"""
+
+    def __init__(self, name, help, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self._series = {}  # label tuple -> [bucket counts..., count, sum]
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = [0] * (len(self.buckets) + 2)
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.buckets):  # anything slower only shows up in +Inf
+            series[index] += 1
+        series[-2] += 1
+        series[-1] += value
+
+    def timer(self, **labels):
+        return _Timer(self, labels)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, series in self._series.items():
+            labels = dict(key)
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_labels(_merge(labels, le=_number(float(bound))))} {cumulative}")
+            lines.append(f"{self.name}_bucket{_labels(_merge(labels, le='+Inf'))} {series[-2]}")
+            lines.append(f"{self.name}_count{_labels(labels)} {series[-2]}")
+            lines.append(f"{self.name}_sum{_labels(labels)} {_number(series[-1])}")
+        return lines
+
+
+class _Timer:
+    __slots__ = ("histogram", "labels", "started")
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started, **self.labels)
+        return False
+
+
+def sample(kind, name, help, value, label=None):
+    """Lines for a gauge or counter; value may be a number or {label value: number}"""
+    lines = [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+    if isinstance(value, dict):
+        for label_value, number in value.items():
+            lines.append(f"{name}{_labels({label: label_value})} {_number(number)}")
+    else:
+        lines.append(f"{name} {_number(value)}")
+    return lines
+
+
+def gauge(name, help, value, label=None):
+    return sample("gauge", name, help, value, label)
+
+
+def counter(name, help, value, label=None):
+    return sample("counter", name, help, value, label)
+
+
+LLM_LATENCY = Histogram("kodok_llm_request_seconds", "DeepSeek call latency, whole reply")
+LLM_FIRST_TOKEN = Histogram("kodok_llm_first_token_seconds", "Time until a streamed DeepSeek reply produced its first text")
+TTS_LATENCY = Histogram("kodok_tts_render_seconds", "Time to synthesize and encode one TTS utterance on a cache miss")
+DB_WAKE = Histogram("kodok_db_wake_seconds", "Time from the first connect attempt to a successful SELECT 1 on a cold database")
+
+
+def render(*sections):
+    """Join histogram and sample lines into one exposition body"""
+    lines = []
+    for section in sections:
+        lines.extend(section.render() if isinstance(section, Histogram) else section)
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,231 @@
+"""Index of members doing something stalk-worthy, kept current from presence events.
+
+The stalk features used to scan every member of a guild to find someone
+with an interesting activity. Instead, PresenceIndex tracks eligible
+members per guild and per activity kind as presence updates arrive, and
+picks a random one in O(1).
+
+classify() is the one place that decides which activities count and how
+they are described; describe_activity and the index both use it.
+
+With LOW_MEMORY_MODE=1 the bot doesn't chunk or cache members, so there
+is nothing to index. PresenceSampler then stands in: it remembers who
+chatted recently plus who opted in with !stalkme, and fetches presences
+for just those members when a stalk feature needs one.
+"""
+import os
+import random
+from collections import OrderedDict
+
+import discord
+
+
+LOW_MEMORY_MODE = os.getenv("LOW_MEMORY_MODE", "0") == "1"
+PRESENCE_SAMPLE = int(os.getenv("PRESENCE_SAMPLE", "50"))  # recent chatters remembered per guild
+QUERY_LIMIT = 100  # Discord's cap on user_ids per member request
+
+
+def client_options():
+    """Extra commands.Bot kwargs for the current memory mode"""
+    if not LOW_MEMORY_MODE:
+        return {}
+    flags = discord.MemberCacheFlags.none()
+    flags.voice = True  # the TTS commands still look people up in voice channels
+    return {"chunk_guilds_at_startup": False, "member_cache_flags": flags}
+
+
+def classify(activity):
+    """(kind, description) for an activity worth commenting on, else None"""
+    # custom statuses are just text people typed, skip them
+    if isinstance(activity, discord.CustomActivity) or getattr(activity, "type", None) == discord.ActivityType.custom:
+        return None
+    if isinstance(activity, discord.Spotify):
+        return "listening", f"listening to {activity.title} by {activity.artist}"
+    if isinstance(activity, discord.Game):
+        return "playing", f"playing {activity.name}"
+    if isinstance(activity, discord.Streaming):
+        return "streaming", f"streaming {activity.name} on {activity.platform}"
+    kind = getattr(activity, "type", None)
+    if kind == discord.ActivityType.watching:
+        return "watching", f"watching {activity.name}"
+    if kind == discord.ActivityType.listening:
+        return "listening", f"listening to {activity.name}"
+    if kind == discord.ActivityType.playing:
+        return "playing", f"playing {activity.name}"
+    if kind == discord.ActivityType.streaming:
+        return "streaming", f"streaming {activity.name}"
+    return None
+
+
+def member_activities(member):
+    """Classified activities for a member who counts (not a bot, not offline)"""
+    if member.bot or member.status == discord.Status.offline:
+        return []
+    return [found for found in map(classify, member.activities) if found]
+
+
+class RandomSet:
+    """Set with O(1) add, discard and random choice"""
+    __slots__ = ("_items", "_positions")
+
+    def __init__(self):
+        self._items = []
+        self._positions = {}
+
+    def add(self, item):
+        if item not in self._positions:
+            self._positions[item] = len(self._items)
+            self._items.append(item)
+
+    def discard(self, item):
+        position = self._positions.pop(item, None)
+        if position is None:
+            return
+        last = self._items.pop()
+        if position < len(self._items):
+            self._items[position] = last
+            self._positions[last] = position
+
+    def choice(self):
+        return random.choice(self._items) if self._items else None
+
+    def __contains__(self, item):
+        return item in self._positions
+
+    def __len__(self):
+        return len(self._items)
+
+
+class PresenceIndex:
+    """guild id -> activity kind -> member ids, plus every eligible member under None"""
+
+    def __init__(self):
+        self._guilds = {}
+        self._kinds = {}  # (guild id, member id) -> kinds the member is indexed under
+
+    def _sets(self, guild_id):
+        sets = self._guilds.get(guild_id)
+        if sets is None:
+            sets = self._guilds[guild_id] = {None: RandomSet()}
+        return sets
+
+    def update(self, member):
+        """Re-index one member after their presence changed"""
+        key = (member.guild.id, member.id)
+        kinds = {kind for kind, _ in member_activities(member)}
+        old = self._kinds.get(key, set())
+        if kinds == old:
+            return
+        sets = self._sets(member.guild.id)
+        for kind in old - kinds:
+            sets[kind].discard(member.id)
+        for kind in kinds - old:
+            sets.setdefault(kind, RandomSet()).add(member.id)
+        if kinds:
+            sets[None].add(member.id)
+            self._kinds[key] = kinds
+        else:
+            sets[None].discard(member.id)
+            self._kinds.pop(key, None)
+
+    def remove(self, guild_id, member_id):
+        kinds = self._kinds.pop((guild_id, member_id), None)
+        if kinds is None:
+            return
+        sets = self._sets(guild_id)
+        sets[None].discard(member_id)
+        for kind in kinds:
+            sets[kind].discard(member_id)
+
+    def load(self, guild):
+        """Index a whole guild; only needed when the bot joins it or (re)connects"""
+        self.drop(guild.id)
+        for member in guild.members:
+            self.update(member)
+
+    def drop(self, guild_id):
+        self._guilds.pop(guild_id, None)
+        self._kinds = {key: kinds for key, kinds in self._kinds.items() if key[0] != guild_id}
+
+    def count(self, guild_id, kind=None):
+        sets = self._guilds.get(guild_id)
+        return len(sets[kind]) if sets and kind in sets else 0
+
+    def random_member(self, guild, kind=None):
+        """A random eligible member of the guild, optionally doing a given kind of activity"""
+        sets = self._guilds.get(guild.id)
+        if not sets or kind not in sets:
+            return None
+        while True:
+            member_id = sets[kind].choice()
+            if member_id is None:
+                return None
+            member = guild.get_member(member_id)
+            if member is None:
+                self.remove(guild.id, member_id)
+                continue
+            self.update(member)  # cheap re-check in case an event was missed
+            if member_id in sets[kind]:
+                return member
+
+    def random_members(self, guild, count, kind=None):
+        """Up to count distinct random eligible members"""
+        chosen = {}
+        for _ in range(count * 3):  # choices can repeat; give up rather than loop on a tiny set
+            if len(chosen) == count:
+                break
+            member = self.random_member(guild, kind)
+            if member is None:
+                break
+            chosen[member.id] = member
+        return list(chosen.values())
+
+
+class PresenceSampler:
+    """Candidates for the stalk features when members aren't cached"""
+
+    def __init__(self, size=PRESENCE_SAMPLE):
+        self.size = size
+        self._recent = {}  # guild id -> OrderedDict of member ids, newest last
+        self.opted_in = {}  # guild id -> set of member ids
+
+    def seen(self, member):
+        if member.bot or not hasattr(member, "guild"):
+            return
+        recent = self._recent.setdefault(member.guild.id, OrderedDict())
+        recent[member.id] = None
+        recent.move_to_end(member.id)
+        if len(recent) > self.size:
+            recent.popitem(last=False)
+
+    def opt_in(self, guild_id, member_id):
+        self.opted_in.setdefault(guild_id, set()).add(member_id)
+
+    def opt_out(self, guild_id, member_id):
+        self.opted_in.get(guild_id, set()).discard(member_id)
+
+    def candidates(self, guild_id):
+        """Opted-in members first, then recent chatters, capped at one member request"""
+        ids = list(self.opted_in.get(guild_id, ()))
+        ids += [member_id for member_id in reversed(self._recent.get(guild_id, ())) if member_id not in ids]
+        return ids[:QUERY_LIMIT]
+
+    async def fetch(self, guild, member_ids):
+        """Members with fresh presences, in one member request"""
+        if not member_ids:
+            return []
+        member_ids = list(member_ids)[:QUERY_LIMIT]
+        return await guild.query_members(user_ids=member_ids, limit=len(member_ids), presences=True, cache=False)
+
+    async def random_members(self, guild, count, kind=None):
+        """Fetch fresh presences for the candidates and pick up to count who are doing something"""
+        members = await self.fetch(guild, self.candidates(guild.id))
+        eligible = [
+            member for member in members
+            if any(kind is None or found == kind for found, _ in member_activities(member))
+        ]
+        return random.sample(eligible, min(count, len(eligible)))
+
+    async def random_member(self, guild, kind=None):
+        members = await self.random_members(guild, 1, kind)
+        return members[0] if members else None
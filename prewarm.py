@@ -0,0 +1,116 @@
+"""Wakes the database before the bot needs it, instead of at fixed times.
+
+The database sleeps when idle and takes a while to answer the first
+query after that. It used to be woken by a fixed 12:57 cron before QOTD
+and by outside pingers hitting /ping. The Prewarmer replaces both:
+
+- Scheduled jobs that need the database are marked with
+  @prewarmer.ahead. A tick every PREWARM_TICK seconds warms the database
+  lead() seconds before each one fires. The lead grows with the wake
+  time Database measures, plus PREWARM_MARGIN.
+- TrafficProfile counts messages per hour of the day, decaying old days.
+  During the busy hours, and for the lead before one starts, the tick
+  keeps the pool from idling longer than PREWARM_KEEPALIVE. That way
+  coordinate and QOTD commands don't land on a cold database.
+"""
+import os
+import time
+from datetime import datetime, timezone
+
+
+PREWARM_TICK = 30  # seconds between planner runs
+PREWARM_MARGIN = float(os.getenv("PREWARM_MARGIN", "30"))  # extra lead on top of twice the measured wake time
+PREWARM_MAX_LEAD = 240  # warming earlier than this risks the database dozing off again
+PREWARM_KEEPALIVE = float(os.getenv("PREWARM_KEEPALIVE", "240"))  # longest idle stretch allowed in busy hours
+PREWARM_BUSY_SHARE = 0.5  # an hour is busy with at least this share of the busiest hour's traffic
+PREWARM_MIN_TRAFFIC = 20  # ...and the busiest hour has seen at least this many messages
+TRAFFIC_DECAY = 0.85  # per day, so the profile follows the server's habits
+
+
+class TrafficProfile:
+    """Messages per UTC hour of the day, decayed daily"""
+
+    def __init__(self, decay=TRAFFIC_DECAY):
+        self.decay = decay
+        self.counts = [0.0] * 24
+        self._day = None
+
+    def _roll(self, now):
+        day = int(now // 86400)
+        if self._day is not None and day > self._day:
+            factor = self.decay ** (day - self._day)
+            self.counts = [count * factor for count in self.counts]
+        self._day = day
+
+    def observe(self, now=None):
+        now = time.time() if now is None else now
+        self._roll(now)
+        self.counts[int(now // 3600) % 24] += 1
+
+    def busy(self, now):
+        """True if the hour containing `now` is one of the busy ones"""
+        peak = max(self.counts)
+        hour = int(now // 3600) % 24
+        return peak >= PREWARM_MIN_TRAFFIC and self.counts[hour] >= peak * PREWARM_BUSY_SHARE
+
+
+class Prewarmer:
+    """Plans database warm-ups around scheduled jobs and busy hours"""
+
+    def __init__(self, database, scheduler, is_leader=lambda: True):
+        self.database = database
+        self.scheduler = scheduler
+        self.is_leader = is_leader  # only the leader runs scheduled jobs, so only it warms for them
+        self.traffic = TrafficProfile()
+        self._jobs = set()  # job functions that need the database
+        self._warmed = {}  # job id -> the run time it was warmed for
+        self.warmups = 0
+        self.keepalives = 0
+        self.failures = 0
+
+    def ahead(self, job):
+        """Mark a scheduled job as needing the database; put it right under @scheduler.scheduled_job"""
+        self._jobs.add(job)
+        return job
+
+    def observe(self):
+        self.traffic.observe()
+
+    def lead(self):
+        """Seconds before a job to start waking the database"""
+        return min(PREWARM_MAX_LEAD, 2 * self.database.wake_estimate() + PREWARM_MARGIN)
+
+    def due(self, now, lead):
+        """Database jobs firing within the lead (plus one tick) that haven't been warmed for"""
+        due = []
+        for job in self.scheduler.get_jobs():
+            if job.func not in self._jobs or job.next_run_time is None:
+                continue
+            seconds = (job.next_run_time - now).total_seconds()
+            if 0 < seconds <= lead + PREWARM_TICK and self._warmed.get(job.id) != job.next_run_time:
+                due.append(job)
+        return due
+
+    async def tick(self):
+        now = datetime.now(timezone.utc)
+        lead = self.lead()
+        due = self.due(now, lead) if self.is_leader() else []
+        if due:
+            names = ", ".join(job.name for job in due)
+            print(f"🔥 Warming the database for {names} (lead {lead:.0f}s)")
+            if await self.database.warm():
+                self.warmups += 1
+                for job in due:
+                    self._warmed[job.id] = job.next_run_time
+            else:
+                self.failures += 1
+                print("❌ Database warm-up failed, retrying next tick")
+            return
+
+        timestamp = now.timestamp()
+        busy = self.traffic.busy(timestamp) or self.traffic.busy(timestamp + lead)
+        if busy and self.database.pool is not None and self.database.idle() >= PREWARM_KEEPALIVE:
+            if await self.database.warm(retries=1):
+                self.keepalives += 1
+            else:
+                self.failures += 1
@@ -0,0 +1,142 @@
+"""Bulk import/export of QOTD questions using COPY.
+
+Importing copies every question into a temp table in one COPY, then a
+single INSERT ... SELECT adds the ones not already in questions or
+used_questions (case- and whitespace-insensitive), keeping file order.
+
+Questions posted before used_questions had a question column were only
+logged by id, and their rows in questions are gone, so there is nothing
+to match them against. Importing reports how many of those there are.
+A file can list already-asked questions under "used_questions" (the
+questions.json format); those are never imported.
+
+    python question_bank.py import [questions.json]
+    python question_bank.py export [backlog.json]
+"""
+import asyncio
+import csv
+import io
+import json
+import os
+import sys
+
+import asyncpg
+
+
+DEFAULT_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "questions.json")
+
+SCHEMA = "ALTER TABLE used_questions ADD COLUMN IF NOT EXISTS question TEXT"
+
+INSERT_NEW_QUESTIONS = """
+WITH incoming AS (
+    SELECT DISTINCT ON (lower(btrim(question))) btrim(question) AS question, position
+    FROM question_import
+    WHERE btrim(question) <> '' AND NOT used
+    ORDER BY lower(btrim(question)), position
+), inserted AS (
+    INSERT INTO questions (question)
+    SELECT i.question FROM incoming i
+    WHERE NOT EXISTS (SELECT 1 FROM questions q WHERE lower(btrim(q.question)) = lower(i.question))
+      AND NOT EXISTS (SELECT 1 FROM used_questions u WHERE lower(btrim(u.question)) = lower(i.question))
+      AND NOT EXISTS (SELECT 1 FROM question_import u WHERE u.used AND lower(btrim(u.question)) = lower(i.question))
+    ORDER BY i.position
+    RETURNING 1
+)
+SELECT count(*) FROM inserted
+"""
+
+
+def _load(data):
+    text = data.decode("utf-8-sig") if isinstance(data, bytes) else data
+    try:
+        return json.loads(text)
+    except ValueError:
+        return [line.strip() for line in text.splitlines() if line.strip()]
+
+
+def parse_questions(data):
+    """Questions from a questions.json-style file, a JSON list, or plain text (one per line)"""
+    parsed = _load(data)
+    if isinstance(parsed, dict):
+        parsed = parsed.get("questions", [])
+    return [str(question) for question in parsed]
+
+
+def parse_used(data):
+    """The "used_questions" list of a questions.json-style file, if it has one"""
+    parsed = _load(data)
+    if not isinstance(parsed, dict):
+        return []
+    return [str(question) for question in parsed.get("used_questions", [])]
+
+
+async def legacy_used_count(conn):
+    """Posted questions logged without their text, which imports can't deduplicate against"""
+    return await conn.fetchval("SELECT count(*) FROM used_questions WHERE question IS NULL")
+
+
+async def import_questions(conn, questions, used=()):
+    """Add new questions in one COPY, skipping any also listed in `used`; returns how many were inserted"""
+    await conn.execute(SCHEMA)  # the dedupe reads used_questions.question
+    records = [(position, question, False) for position, question in enumerate(questions)]
+    records += [(len(records) + position, question, True) for position, question in enumerate(used)]
+    async with conn.transaction():
+        await conn.execute(
+            "CREATE TEMP TABLE question_import (position INT, question TEXT, used BOOLEAN) ON COMMIT DROP"
+        )
+        await conn.copy_records_to_table(
+            "question_import",
+            records=records,
+            columns=["position", "question", "used"]
+        )
+        return await conn.fetchval(INSERT_NEW_QUESTIONS)
+
+
+def legacy_warning(legacy):
+    if not legacy:
+        return ""
+    return (f"{legacy} questions were posted before their text was logged and can't be matched; "
+            "if the file still has them they were queued again (list them under \"used_questions\" to skip them)")
+
+
+async def export_questions(conn):
+    """The unused backlog, in posting order, as a questions.json-style dict"""
+    buffer = io.BytesIO()
+    await conn.copy_from_query("SELECT question FROM questions ORDER BY id", output=buffer, format="csv")
+    rows = csv.reader(io.StringIO(buffer.getvalue().decode()))
+    return {"questions": [row[0] for row in rows if row]}
+
+
+async def main(argv):
+    if len(argv) < 2 or argv[1] not in ("import", "export"):
+        print(__doc__)
+        return 1
+
+    conn = await asyncpg.connect(os.getenv("DATABASE_URL"))
+    try:
+        if argv[1] == "import":
+            path = argv[2] if len(argv) > 2 else DEFAULT_FILE
+            with open(path, "rb") as file:
+                data = file.read()
+            questions = parse_questions(data)
+            inserted = await import_questions(conn, questions, parse_used(data))
+            print(f"Imported {inserted} new questions ({len(questions) - inserted} duplicates skipped)")
+            warning = legacy_warning(await legacy_used_count(conn))
+            if warning:
+                print(f"Warning: {warning}")
+        else:
+            backlog = await export_questions(conn)
+            output = json.dumps(backlog, indent=4, ensure_ascii=False)
+            if len(argv) > 2:
+                with open(argv[2], "w", encoding="utf-8") as file:
+                    file.write(output)
+                print(f"Exported {len(backlog['questions'])} questions to {argv[2]}")
+            else:
+                print(output)
+    finally:
+        await conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main(sys.argv)))
@@ -0,0 +1,99 @@
+"""Trigger matching for on_message.
+
+Triggers are registered in priority order. Regex triggers are anchored at
+the start of the lowercased message and folded into one combined
+alternation, so a message is scanned once no matter how many triggers
+exist; the regex engine tries alternatives in order, which keeps the
+first-registered trigger winning. Predicate triggers (substring checks,
+session lookups) are only evaluated if they come before the first regex
+hit.
+"""
+import inspect
+import re
+
+
+class Trigger:
+    __slots__ = ("name", "pattern", "check", "handler")
+
+    def __init__(self, name, handler, pattern=None, check=None):
+        self.name = name
+        self.handler = handler
+        self.pattern = pattern
+        self.check = check
+
+
+class Router:
+    """Ordered, named message triggers"""
+
+    def __init__(self):
+        self.triggers = []
+        self._combined = None
+        self._checks_before = None
+        self._by_group = None
+
+    def regex(self, name, pattern):
+        """Register a handler(message, match) for messages whose lowercased text starts with pattern"""
+        def decorator(handler):
+            self._add(Trigger(name, handler, pattern=re.compile(pattern)))
+            return handler
+        return decorator
+
+    def when(self, name, check):
+        """Register a handler(message, result) for messages where check(message, text) is truthy"""
+        def decorator(handler):
+            self._add(Trigger(name, handler, check=check))
+            return handler
+        return decorator
+
+    def _add(self, trigger):
+        if any(existing.name == trigger.name for existing in self.triggers):
+            raise ValueError(f"duplicate trigger name: {trigger.name}")
+        self.triggers.append(trigger)
+        self._combined = None
+
+    def _compile(self):
+        alternatives = []
+        self._by_group = {}
+        for index, trigger in enumerate(self.triggers):
+            if trigger.pattern is not None:
+                group = f"t{index}"
+                alternatives.append(f"(?P<{group}>{trigger.pattern.pattern})")
+                self._by_group[group] = index
+        self._combined = re.compile("|".join(alternatives)) if alternatives else re.compile(r"(?!)")
+
+        # predicate triggers that outrank the regex trigger at each position
+        self._checks_before = []
+        checks = []
+        for trigger in self.triggers:
+            self._checks_before.append(tuple(checks))
+            if trigger.check is not None:
+                checks.append(trigger)
+        self._checks_before.append(tuple(checks))
+
+    async def match(self, message, text=None):
+        """Return (trigger, match) for the highest-priority trigger, or (None, None)"""
+        if self._combined is None:
+            self._compile()
+        if text is None:
+            text = message.content.lower()
+
+        hit = self._combined.match(text)
+        first = self._by_group[hit.lastgroup] if hit else len(self.triggers)
+        for trigger in self._checks_before[first]:
+            result = trigger.check(message, text)
+            if inspect.isawaitable(result):
+                result = await result
+            if result:
+                return trigger, result
+        if hit:
+            trigger = self.triggers[first]
+            return trigger, trigger.pattern.match(text)
+        return None, None
+
+    async def dispatch(self, message):
+        """Run the matching trigger's handler; returns its name, or None if nothing matched"""
+        trigger, match = await self.match(message)
+        if trigger is None:
+            return None
+        await trigger.handler(message, match)
+        return trigger.name
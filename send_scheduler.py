@@ -0,0 +1,194 @@
+"""Per-channel outbound send scheduler.
+
+Every channel gets its own queue and worker, so a busy channel only
+delays itself. Each worker spends tokens from a per-channel bucket sized
+after Discord's message route limit (5 sends per 5s) plus one shared
+bot-wide bucket, and 429s are retried in place using the rate-limit
+headers Discord sends back.
+"""
+import asyncio
+import time
+
+import discord
+
+from tracing import tracer
+
+
+CHANNEL_RATE = (5, 5.0)  # Discord: 5 messages per 5s per channel
+GLOBAL_RATE = (50, 1.0)  # Discord: 50 requests per second per bot
+MAX_SEND_ATTEMPTS = 5
+WORKER_IDLE_TIMEOUT = 60  # seconds before an idle channel worker exits
+
+
+class TokenBucket:
+    """Token bucket that can be resized and paused from rate-limit headers"""
+    __slots__ = ("capacity", "per", "tokens", "updated", "blocked_until")
+
+    def __init__(self, capacity, per):
+        self.capacity = capacity
+        self.per = per
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.capacity / self.per)
+        self.updated = now
+
+    def wait_time(self):
+        """Take a token if one is free, otherwise return how long to wait"""
+        now = time.monotonic()
+        if self.blocked_until:
+            if now < self.blocked_until:
+                return self.blocked_until - now
+            # the window Discord told us to wait out has reset
+            self.blocked_until = 0.0
+            self.tokens = max(self.tokens, 1.0)
+            self.updated = now
+        self._refill(now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) * self.per / self.capacity
+
+    def idle(self, now):
+        """True once the bucket has refilled completely, so forgetting it loses nothing"""
+        return now >= self.blocked_until and now - self.updated >= self.per
+
+    async def acquire(self):
+        while True:
+            delay = self.wait_time()
+            if not delay:
+                return
+            await asyncio.sleep(delay)
+
+    def block(self, seconds):
+        """Pause the bucket, e.g. after a 429"""
+        self.tokens = 0.0
+        self.updated = time.monotonic()
+        self.blocked_until = max(self.blocked_until, self.updated + seconds)
+
+    def update_from_headers(self, headers):
+        """Follow X-RateLimit-* headers from a Discord response"""
+        try:
+            limit = headers.get("X-RateLimit-Limit")
+            reset_after = headers.get("X-RateLimit-Reset-After")
+            remaining = headers.get("X-RateLimit-Remaining")
+            if limit:
+                self.capacity = max(1, int(limit))
+            if reset_after and remaining == "0":
+                self.block(float(reset_after))
+        except (TypeError, ValueError):
+            pass
+
+
+def retry_after_from(error):
+    """Seconds to wait after a 429, read from the exception or its headers"""
+    if isinstance(error, discord.RateLimited):
+        return error.retry_after
+    headers = getattr(error.response, "headers", None) or {}
+    for header in ("Retry-After", "X-RateLimit-Reset-After"):
+        try:
+            return float(headers[header])
+        except (KeyError, TypeError, ValueError):
+            continue
+    return 1.0
+
+
+async def send_reply(message, response):
+    await message.reply(response, mention_author=False)
+
+
+class SendScheduler:
+    """Queues (message, response) pairs per channel and sends channels in parallel"""
+
+    def __init__(self, send=send_reply):
+        self._send = send
+        self._queues = {}
+        self._buckets = {}
+        self._prune_at = 64  # bucket count that triggers the next sweep of idle buckets
+        self._global = TokenBucket(*GLOBAL_RATE)
+        self.rate_limit_hits = 0
+
+    async def put(self, item):
+        message, _ = item
+        channel_id = message.channel.id
+        queue = self._queues.get(channel_id)
+        if queue is None:
+            queue = self._queues[channel_id] = asyncio.Queue()
+            asyncio.create_task(self._drain(channel_id, queue))
+        queue.put_nowait((*item, time.perf_counter()))
+
+    def qsize(self):
+        return sum(queue.qsize() for queue in self._queues.values())
+
+    def channel_depths(self):
+        return {channel_id: queue.qsize() for channel_id, queue in self._queues.items()}
+
+    def _bucket(self, channel_id):
+        bucket = self._buckets.get(channel_id)
+        if bucket is None:
+            if len(self._buckets) >= self._prune_at:
+                self._prune_buckets()
+            bucket = self._buckets[channel_id] = TokenBucket(*CHANNEL_RATE)
+        return bucket
+
+    def _prune_buckets(self):
+        """Forget full buckets of channels without a worker (e.g. ones only streamed to)"""
+        now = time.monotonic()
+        for channel_id in [channel_id for channel_id, bucket in self._buckets.items()
+                           if channel_id not in self._queues and bucket.idle(now)]:
+            del self._buckets[channel_id]
+        self._prune_at = max(64, 2 * len(self._buckets))
+
+    async def acquire(self, channel_id):
+        """Wait for send capacity in a channel, for callers that send directly"""
+        await self._bucket(channel_id).acquire()
+        await self._global.acquire()
+
+    async def _drain(self, channel_id, queue):
+        try:
+            while True:
+                try:
+                    item = await asyncio.wait_for(queue.get(), WORKER_IDLE_TIMEOUT)
+                except asyncio.TimeoutError:
+                    # a put() can land while the timed-out get() is being cancelled
+                    if queue.empty():
+                        return
+                    continue
+                try:
+                    await self._deliver(channel_id, *item)
+                finally:
+                    queue.task_done()
+        finally:
+            # nothing awaits between the empty() check and here, so no put() can slip in
+            del self._queues[channel_id]
+            bucket = self._buckets.get(channel_id)
+            if bucket is not None and bucket.idle(time.monotonic()):
+                del self._buckets[channel_id]
+
+    async def _deliver(self, channel_id, message, response, enqueued):
+        bucket = self._bucket(channel_id)
+        tracer.record("send_queue", time.perf_counter() - enqueued)
+        for attempt in range(MAX_SEND_ATTEMPTS):
+            with tracer.span("send_throttle"):
+                await bucket.acquire()
+                await self._global.acquire()
+            try:
+                with tracer.span("send"):
+                    await self._send(message, response)
+                return
+            except (discord.HTTPException, discord.RateLimited) as e:
+                if isinstance(e, discord.HTTPException) and e.status != 429:
+                    print(f"Failed to send message: {str(e)}")
+                    return
+                self.rate_limit_hits += 1
+                retry_after = retry_after_from(e)
+                if isinstance(e, discord.HTTPException):
+                    bucket.update_from_headers(e.response.headers)
+                bucket.block(retry_after)
+                print(f"Rate limited in channel {channel_id}. Retrying after {retry_after}s")
+            except Exception as e:
+                print(f"Failed to send message: {str(e)}")
+                return
+        print(f"Giving up on message in channel {channel_id} after {MAX_SEND_ATTEMPTS} attempts")
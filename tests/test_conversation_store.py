@@ -0,0 +1,61 @@
+"""ConversationStore restore and expiry against a fake database."""
+import asyncio
+import contextlib
+import datetime
+import json
+import time
+
+from conversation_store import ConversationStore
+
+
+class FakeConn:
+    def __init__(self, rows):
+        self.rows = rows
+
+    async def execute(self, query, *args):
+        pass
+
+    async def fetch(self, query, *args):
+        return self.rows
+
+
+class FakeDatabase:
+    def __init__(self, rows=()):
+        self.rows = list(rows)
+
+    @contextlib.asynccontextmanager
+    async def acquire(self, timeout=None):
+        yield FakeConn(self.rows)
+
+
+def row(user_id, channel_id, text="hi"):
+    return {
+        "user_id": user_id,
+        "channel_id": channel_id,
+        "messages": json.dumps([{"role": "user", "content": text}]),
+        "updated_at": datetime.datetime.now(datetime.timezone.utc),
+    }
+
+
+def test_restore_loads_saved_sessions():
+    store = ConversationStore(FakeDatabase([row(1, 1), row(2, 1)]), 20, 180)
+    asyncio.run(store.restore())
+    assert (1, 1) in store and (2, 1) in store
+
+
+def test_restore_skips_sessions_deleted_before_the_flush():
+    store = ConversationStore(FakeDatabase([row(1, 1)]), 20, 180)
+    store.append((1, 1), "user", "okay shut up kodok")
+    del store[(1, 1)]  # the DELETE is only queued until the next flush
+    asyncio.run(store.restore())
+    assert (1, 1) not in store
+
+
+def test_expiring_an_untouched_restored_session_leaves_its_row():
+    store = ConversationStore(FakeDatabase([row(1, 1), row(2, 1)]), 20, 180)
+    asyncio.run(store.restore())
+    store.append((2, 1), "user", "still here")
+    expired = store.expire(time.monotonic() + 1000)
+    assert sorted(expired) == [(1, 1), (2, 1)]
+    # (1, 1) may belong to another worker, which still uses it
+    assert store._deleted == {(2, 1)}
@@ -0,0 +1,46 @@
+"""CoordinateCache applying NOTIFY changes on top of refreshed snapshots."""
+import asyncio
+import contextlib
+import json
+
+from coords_cache import CHANNEL, CoordinateCache
+
+
+class FakeConn:
+    def __init__(self, rows):
+        self.rows = rows
+
+    async def fetch(self, query, *args):
+        return [dict(row) for row in self.rows]
+
+
+class FakeDatabase:
+    def __init__(self, rows):
+        self.rows = rows
+
+    @contextlib.asynccontextmanager
+    async def acquire(self, timeout=None):
+        yield FakeConn(self.rows)
+
+
+def notify(cache, change):
+    cache._on_notify(None, 0, CHANNEL, json.dumps(dict(change, origin="another-instance")))
+
+
+def test_late_add_notification_does_not_duplicate_a_refreshed_point():
+    database = FakeDatabase([{"name": "base", "x": 1, "z": 2}])
+    cache = CoordinateCache(database, None)
+    asyncio.run(cache.refresh())
+    notify(cache, {"op": "add", "name": "base", "x": 1, "z": 2})
+    assert len(cache.index) == 1
+    assert asyncio.run(cache.rows()) == [{"name": "base", "x": 1, "z": 2}]
+
+
+def test_add_notification_adds_a_new_point():
+    database = FakeDatabase([{"name": "base", "x": 1, "z": 2}])
+    cache = CoordinateCache(database, None)
+    asyncio.run(cache.refresh())
+    notify(cache, {"op": "add", "name": "farm", "x": 300, "z": -40})
+    assert not cache.stale
+    assert [point[1] for point in cache.index.nearest(300, -40)] == ["farm"]
+    assert len(cache.index) == 2
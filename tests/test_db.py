@@ -0,0 +1,101 @@
+"""CircuitBreaker transitions and how Database.acquire drives them."""
+import asyncio
+import contextlib
+
+import pytest
+
+import db
+from db import CircuitBreaker, Database, DatabaseUnavailable
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(db.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_opens_after_threshold(clock):
+    breaker = CircuitBreaker(threshold=3, reset=30)
+    for _ in range(2):
+        breaker.failure()
+    assert breaker.state == "closed" and breaker.allow()
+    breaker.failure()
+    assert breaker.state == "open"
+    assert not breaker.allow()
+
+
+def test_half_open_lets_one_trial_through(clock):
+    breaker = CircuitBreaker(threshold=1, reset=30)
+    breaker.failure()
+    clock[0] += 30
+    assert breaker.allow()
+    assert breaker.state == "half-open"
+    assert not breaker.allow()
+
+
+def test_trial_result_settles_half_open(clock):
+    breaker = CircuitBreaker(threshold=1, reset=30)
+    breaker.failure()
+    clock[0] += 30
+    breaker.allow()
+    breaker.failure()
+    assert breaker.state == "open" and not breaker.allow()
+    clock[0] += 30
+    breaker.allow()
+    breaker.success()
+    assert breaker.state == "closed" and breaker.failures == 0
+
+
+def test_unreported_trial_times_out(clock):
+    breaker = CircuitBreaker(threshold=1, reset=30)
+    breaker.failure()
+    clock[0] += 30
+    assert breaker.allow()  # the trial starts and never reports back
+    clock[0] += 29
+    assert not breaker.allow()
+    clock[0] += 1
+    assert breaker.allow()
+
+
+class Pool:
+    @contextlib.asynccontextmanager
+    async def acquire(self, timeout=None):
+        yield object()
+
+
+def test_cancelled_trial_does_not_wedge_acquire():
+    async def scenario():
+        database = Database("postgres://test")
+        database.breaker.reset = 0.05
+        delay = [10.0]
+
+        async def check():
+            await asyncio.sleep(delay[0])
+            database.pool = Pool()
+            database._ok()
+
+        database._check = check
+        for _ in range(database.breaker.threshold):
+            database.breaker.failure()
+        assert database.breaker.state == "open"
+        await asyncio.sleep(0.05)
+
+        with pytest.raises(TimeoutError):
+            async with asyncio.timeout(0.01):
+                async with database.acquire():
+                    pass
+        assert database.breaker.state == "open"
+
+        with pytest.raises(DatabaseUnavailable):
+            async with database.acquire():
+                pass
+
+        await asyncio.sleep(0.05)
+        delay[0] = 0
+        async with database.acquire():
+            pass
+        assert database.breaker.state == "closed"
+        assert await database.ensure()
+
+    asyncio.run(scenario())
@@ -0,0 +1,156 @@
+"""Router.match ordering, generic and for the bot's own triggers."""
+import asyncio
+import contextlib
+import io
+
+import pytest
+
+from conversation_store import ConversationStore
+from router import Router
+
+with contextlib.redirect_stdout(io.StringIO()):
+    import main
+
+
+class Author:
+    def __init__(self, user_id):
+        self.id = user_id
+        self.bot = False
+
+
+class Channel:
+    def __init__(self, channel_id):
+        self.id = channel_id
+        self.name = "general"
+
+
+class Message:
+    def __init__(self, content, user_id=1, channel_id=1):
+        self.content = content
+        self.author = Author(user_id)
+        self.channel = Channel(channel_id)
+        self.guild = None
+
+
+def match(router, content):
+    trigger, result = asyncio.run(router.match(Message(content)))
+    return (trigger.name if trigger else None), result
+
+
+async def noop(message, match):
+    pass
+
+
+def test_first_registered_regex_wins():
+    router = Router()
+    router.regex("specific", r"hello there")(noop)
+    router.regex("general", r"hello")(noop)
+    assert match(router, "hello there")[0] == "specific"
+    assert match(router, "hello you")[0] == "general"
+
+
+def test_regex_is_anchored_and_case_insensitive_on_input():
+    router = Router()
+    router.regex("greet", r"hello (\w+)")(noop)
+    name, result = match(router, "HELLO Bob")
+    assert name == "greet"
+    assert result.group(1) == "bob"
+    assert match(router, "well hello bob")[0] is None
+
+
+def test_predicate_before_regex_wins():
+    router = Router()
+    router.when("always", lambda message, text: True)(noop)
+    router.regex("greet", r"hello")(noop)
+    assert match(router, "hello")[0] == "always"
+
+
+def test_predicate_after_regex_hit_is_not_evaluated():
+    calls = []
+    router = Router()
+    router.regex("greet", r"hello")(noop)
+    router.when("late", lambda message, text: calls.append(text) or True)(noop)
+    assert match(router, "hello")[0] == "greet"
+    assert calls == []
+    assert match(router, "bye")[0] == "late"
+    assert calls == ["bye"]
+
+
+def test_async_predicates_are_awaited():
+    async def check(message, text):
+        return "found"
+
+    router = Router()
+    router.when("async", check)(noop)
+    assert match(router, "anything") == ("async", "found")
+
+
+def test_duplicate_names_are_rejected():
+    router = Router()
+    router.regex("greet", r"hello")(noop)
+    with pytest.raises(ValueError):
+        router.regex("greet", r"hi")(noop)
+
+
+def test_bot_trigger_order():
+    names = [trigger.name for trigger in main.message_router.triggers]
+    assert names == [
+        "shut_up", "woi_kodok", "conversation", "add_coordinate", "delete_coordinate",
+        "list_coordinates", "nearest_coordinate", "coordinates_within", "rock_paper_scissors",
+        "compatibility", "what_do_you_think", "special_names", "metal_kodok",
+    ]
+
+
+@pytest.fixture
+def sessions(monkeypatch):
+    store = ConversationStore(None, main.MAX_HISTORY, main.SESSION_TIMEOUT)
+    monkeypatch.setattr(main, "conversation_histories", store)
+    return store
+
+
+@pytest.mark.parametrize("content, expected", [
+    ("okay shut up kodok", "shut_up"),
+    ("woi kodok apa kabar", "woi_kodok"),
+    ("coords po o", "list_coordinates"),
+    ("add base 100 -200 dong", "add_coordinate"),
+    ("hey metal kodok", "metal_kodok"),
+    ("lol", None),
+])
+def test_bot_without_session(sessions, content, expected):
+    assert match(main.message_router, content)[0] == expected
+
+
+@pytest.mark.parametrize("content, expected", [
+    ("okay shut up kodok", "shut_up"),
+    ("woi kodok apa kabar", "woi_kodok"),
+    ("coords po o", "conversation"),
+    ("add base 100 -200 dong", "conversation"),
+    ("hey metal kodok", "conversation"),
+    ("lol", "conversation"),
+])
+def test_live_session_beats_later_triggers(sessions, content, expected):
+    sessions.append((1, 1), "user", "hi")
+    assert match(main.message_router, content)[0] == expected
+
+
+def test_session_is_per_user_and_channel(sessions):
+    sessions.append((1, 1), "user", "hi")
+    trigger, _ = asyncio.run(main.message_router.match(Message("coords po o", user_id=2)))
+    assert trigger.name == "list_coordinates"
+    trigger, _ = asyncio.run(main.message_router.match(Message("coords po o", channel_id=2)))
+    assert trigger.name == "list_coordinates"
+
+
+def test_expired_session_claims_one_message_then_routes_normally(sessions):
+    # like the old if-chain: an expired but unswept session still takes the
+    # message, the handler drops the session without replying, and the next
+    # message is routed as if there had been none
+    sessions.append((1, 1), "user", "hi")
+    sessions[(1, 1)].last_seen -= main.SESSION_TIMEOUT + 1
+
+    async def dispatch(content):
+        return await main.message_router.dispatch(Message(content))
+
+    assert asyncio.run(dispatch("coords po o")) == "conversation"
+    assert (1, 1) not in sessions
+    assert match(main.message_router, "coords po o")[0] == "list_coordinates"
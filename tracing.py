@@ -0,0 +1,125 @@
+"""Per-stage latency spans kept in ring buffers, for !perf and /metrics.
+
+A span is two perf_counter() calls and a deque append, cheap enough to
+leave on in production. Each stage keeps its last TRACE_BUFFER durations;
+percentiles are only computed when someone asks for them.
+
+Spans opened while a trace() is running are also collected into that
+trace, so a message that took longer than TRACE_SLOW seconds end to end
+gets its stage breakdown printed.
+"""
+import contextlib
+import contextvars
+import os
+import time
+from collections import deque
+
+
+TRACE_BUFFER = int(os.getenv("TRACE_BUFFER", "2048"))  # durations kept per stage
+TRACE_SLOW = float(os.getenv("TRACE_SLOW", "10"))  # seconds; slower traces get printed
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+_current = contextvars.ContextVar("trace", default=None)
+
+
+class _Trace:
+    __slots__ = ("name", "spans", "open")
+
+    def __init__(self, name):
+        self.name = name
+        self.spans = []
+        self.open = True
+
+
+class _Span:
+    __slots__ = ("tracer", "stage", "started")
+
+    def __init__(self, tracer, stage):
+        self.tracer = tracer
+        self.stage = stage
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.tracer.record(self.stage, time.perf_counter() - self.started)
+        return False
+
+
+class Tracer:
+    """Ring buffer of span durations per stage"""
+
+    def __init__(self, capacity=TRACE_BUFFER):
+        self.capacity = capacity
+        self._stages = {}
+        self._counts = {}
+        self._sums = {}
+
+    def record(self, stage, seconds):
+        durations = self._stages.get(stage)
+        if durations is None:
+            durations = self._stages[stage] = deque(maxlen=self.capacity)
+            self._counts[stage] = 0
+            self._sums[stage] = 0.0
+        durations.append(seconds)
+        self._counts[stage] += 1
+        self._sums[stage] += seconds
+        trace = _current.get()
+        # tasks spawned inside a trace inherit it; only the open one collects
+        if trace is not None and trace.open:
+            trace.spans.append((stage, seconds))
+
+    def span(self, stage):
+        return _Span(self, stage)
+
+    @contextlib.asynccontextmanager
+    async def waited(self, lock, stage):
+        """async with a lock, recording how long acquiring it took"""
+        started = time.perf_counter()
+        async with lock:
+            self.record(stage, time.perf_counter() - started)
+            yield
+
+    @contextlib.asynccontextmanager
+    async def trace(self, name):
+        """Root span: records `name` and prints the breakdown when it's slow"""
+        trace = _Trace(name)
+        token = _current.set(trace)
+        started = time.perf_counter()
+        try:
+            yield trace
+        finally:
+            elapsed = time.perf_counter() - started
+            _current.reset(token)
+            trace.open = False
+            self.record(name, elapsed)
+            if elapsed >= TRACE_SLOW:
+                stages = ", ".join(f"{stage}={seconds * 1000:.0f}ms" for stage, seconds in trace.spans)
+                print(f"🐢 Slow {name}: {elapsed * 1000:.0f}ms ({stages})")
+
+    def percentiles(self, stage, quantiles=QUANTILES):
+        durations = sorted(self._stages.get(stage, ()))
+        if not durations:
+            return {}
+        last = len(durations) - 1
+        return {q: durations[min(last, int(q * len(durations)))] for q in quantiles}
+
+    def summary(self):
+        """{stage: (spans ever recorded, {quantile: seconds})} over the buffered window"""
+        return {stage: (self._counts[stage], self.percentiles(stage)) for stage in sorted(self._stages)}
+
+    def render(self):
+        """Prometheus summary lines for the /metrics route"""
+        name = "kodok_stage_seconds"
+        lines = [f"# HELP {name} Latency per stage over the last {self.capacity} spans", f"# TYPE {name} summary"]
+        for stage, (count, quantiles) in self.summary().items():
+            for q, seconds in quantiles.items():
+                lines.append(f'{name}{{stage="{stage}",quantile="{q}"}} {seconds:.6f}')
+            lines.append(f'{name}_sum{{stage="{stage}"}} {self._sums[stage]:.6f}')
+            lines.append(f'{name}_count{{stage="{stage}"}} {count}')
+        return lines
+
+
+tracer = Tracer()
@@ -0,0 +1,303 @@
+"""Queued text-to-speech playback for the vc-chat reader.
+
+Each voice client gets a TTSPlayer with two stages: a synth task that
+turns queued text into Ogg Opus in a worker thread, and a play task that
+sends the Opus packets straight to Discord. The synth task runs up to
+TTS_PREFETCH utterances ahead, so the next one is ready by the time the
+current one finishes.
+
+Synthesis goes through a backend: gTTS (Google, needs network) or a local
+espeak-ng. TTS_BACKEND picks the default, and !ttsbackend overrides it per
+guild.
+
+Synthesized audio is kept in an LRU cache keyed by a hash of (backend,
+text, lang), so repeated phrases skip synthesis and FFmpeg entirely. Set
+TTS_CACHE_DIR to spill evicted entries to disk instead of losing them.
+"""
+import asyncio
+import contextlib
+import hashlib
+import io
+import os
+import subprocess
+import time
+from collections import OrderedDict
+
+import discord
+from discord.oggparse import OggStream
+from gtts import gTTS
+
+from metrics import TTS_LATENCY
+from tracing import tracer
+
+
+TTS_QUEUE_SIZE = 20  # utterances waiting for synthesis before new ones are dropped
+TTS_PREFETCH = 2  # synthesized utterances waiting for playback
+TTS_CACHE_BYTES = int(os.getenv("TTS_CACHE_BYTES", str(16 * 1024 * 1024)))
+TTS_CACHE_DIR = os.getenv("TTS_CACHE_DIR")
+TTS_CACHE_DISK_BYTES = int(os.getenv("TTS_CACHE_DISK_BYTES", str(256 * 1024 * 1024)))
+TTS_BACKEND = os.getenv("TTS_BACKEND", "gtts")
+
+players = {}  # guild id -> TTSPlayer
+guild_backends = {}  # guild id -> backend name, overrides TTS_BACKEND
+
+
+def encode_opus(audio):
+    """Blocking FFmpeg call; any audio FFmpeg can read in, 48kHz stereo Ogg Opus out"""
+    result = subprocess.run(
+        ["ffmpeg", "-loglevel", "error", "-i", "pipe:0",
+         "-ar", "48000", "-ac", "2", "-c:a", "libopus", "-b:a", "64k", "-f", "ogg", "pipe:1"],
+        input=audio, capture_output=True, check=True
+    )
+    return result.stdout
+
+
+class GTTSBackend:
+    """Google Translate TTS; good voices, one HTTP round-trip per utterance"""
+    name = "gtts"
+
+    def synthesize(self, text, lang):
+        """Blocking; returns MP3 bytes"""
+        buffer = io.BytesIO()
+        gTTS(text=text, lang=lang).write_to_fp(buffer)
+        return buffer.getvalue()
+
+    def render(self, text, lang):
+        """Blocking; text to ready-to-play Ogg Opus"""
+        return encode_opus(self.synthesize(text, lang))
+
+
+class EspeakBackend:
+    """Local espeak-ng; robotic, but offline and fast"""
+    name = "espeak"
+
+    def __init__(self, executable=os.getenv("ESPEAK_PATH", "espeak-ng")):
+        self.executable = executable
+
+    def synthesize(self, text, lang):
+        """Blocking; returns WAV bytes"""
+        result = subprocess.run(
+            [self.executable, "-v", lang, "--stdout", "--stdin"],
+            input=text.encode(), capture_output=True, check=True
+        )
+        return result.stdout
+
+    def render(self, text, lang):
+        """Blocking; text to ready-to-play Ogg Opus"""
+        return encode_opus(self.synthesize(text, lang))
+
+
+BACKENDS = {backend.name: backend for backend in (GTTSBackend(), EspeakBackend())}
+
+
+def backend_for(guild_id):
+    name = guild_backends.get(guild_id, TTS_BACKEND)
+    return BACKENDS.get(name, BACKENDS["gtts"])
+
+
+def set_backend(guild_id, name):
+    """Pick the TTS backend for one guild; returns False for unknown names"""
+    if name not in BACKENDS:
+        return False
+    guild_backends[guild_id] = name
+    return True
+
+
+def cache_key(backend, text, lang):
+    return hashlib.sha256(f"{backend.name}\0{lang}\0{text}".encode()).hexdigest()
+
+
+class AudioCache:
+    """LRU of encoded audio bounded by total bytes, with an optional disk tier"""
+
+    def __init__(self, max_bytes=TTS_CACHE_BYTES, spill_dir=TTS_CACHE_DIR, max_disk_bytes=TTS_CACHE_DISK_BYTES):
+        self.max_bytes = max_bytes
+        self.spill_dir = spill_dir
+        self.max_disk_bytes = max_disk_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        if spill_dir:
+            os.makedirs(spill_dir, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.spill_dir, f"{key}.ogg")
+
+    def _read(self, key):
+        """Spilled audio or None; runs in a worker thread"""
+        try:
+            with open(self._path(key), "rb") as file:
+                return file.read()
+        except OSError:
+            return None
+
+    def put(self, key, audio):
+        """Keep audio in memory; returns the (key, audio) pairs evicted to make room"""
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._bytes -= len(old)
+        self._entries[key] = audio
+        self._bytes += len(audio)
+        evicted = []
+        while self._bytes > self.max_bytes and len(self._entries) > 1:
+            evicted_key, evicted_audio = self._entries.popitem(last=False)
+            self._bytes -= len(evicted_audio)
+            evicted.append((evicted_key, evicted_audio))
+        return evicted
+
+    def _spill(self, evicted):
+        """Write evicted audio to disk and trim it; runs in a worker thread"""
+        try:
+            for key, audio in evicted:
+                path = self._path(key)
+                if not os.path.exists(path):
+                    with open(path, "wb") as file:
+                        file.write(audio)
+            self._trim_disk()
+        except OSError as e:
+            print(f"Error spilling TTS audio to disk: {e}")
+
+    def _trim_disk(self):
+        files = []
+        for entry in os.scandir(self.spill_dir):
+            if entry.name.endswith(".ogg"):
+                try:
+                    files.append((entry.stat().st_mtime, entry.stat().st_size, entry.path))
+                except OSError:
+                    continue  # removed by another trim meanwhile
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_disk_bytes:
+                break
+            total -= size
+            with contextlib.suppress(OSError):
+                os.remove(path)
+
+    async def render(self, text, lang, backend):
+        """Cached audio for (text, lang), rendering it in a worker thread on a miss.
+
+        Cache bookkeeping stays on the event loop; only disk reads, spills
+        and renders go to worker threads.
+        """
+        loop = asyncio.get_running_loop()
+        key = cache_key(backend, text, lang)
+        audio = self._entries.get(key)
+        if audio is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return audio
+        if self.spill_dir:
+            audio = await loop.run_in_executor(None, self._read, key)
+        if audio is not None:
+            self.hits += 1
+        else:
+            self.misses += 1
+            print(f"Generating TTS audio for: {text}")
+            with TTS_LATENCY.timer(backend=backend.name):
+                audio = await loop.run_in_executor(None, backend.render, text, lang)
+        evicted = self.put(key, audio)
+        if evicted and self.spill_dir:
+            loop.run_in_executor(None, self._spill, evicted)  # nobody waits on the disk write
+        return audio
+
+
+audio_cache = AudioCache()
+
+
+class OpusPacketSource(discord.AudioSource):
+    """Plays Ogg Opus bytes from memory without spawning FFmpeg"""
+
+    def __init__(self, ogg):
+        self._packets = (
+            packet for packet in OggStream(io.BytesIO(ogg)).iter_packets()
+            if not packet.startswith((b"OpusHead", b"OpusTags"))
+        )
+
+    def read(self):
+        return next(self._packets, b"")
+
+    def is_opus(self):
+        return True
+
+
+class TTSPlayer:
+    """Plays utterances for one voice client in the order they were queued"""
+
+    def __init__(self, voice_client):
+        self.voice_client = voice_client
+        self._texts = asyncio.Queue(maxsize=TTS_QUEUE_SIZE)
+        self._ready = asyncio.Queue(maxsize=TTS_PREFETCH)
+        self._tasks = [
+            asyncio.create_task(self._synth_loop()),
+            asyncio.create_task(self._play_loop()),
+        ]
+
+    def depth(self):
+        """Utterances waiting to be synthesized or played"""
+        return self._texts.qsize() + self._ready.qsize()
+
+    def say(self, text, lang="id"):
+        try:
+            self._texts.put_nowait((text, lang, time.perf_counter()))
+            return True
+        except asyncio.QueueFull:
+            print(f"TTS queue full, dropping: {text}")
+            return False
+
+    async def _synth_loop(self):
+        while True:
+            text, lang, queued = await self._texts.get()
+            tracer.record("tts_queue", time.perf_counter() - queued)
+            try:
+                with tracer.span("tts_synth"):
+                    audio = await audio_cache.render(text, lang, backend_for(self.voice_client.guild.id))
+            except Exception as e:
+                print(f"Error in TTS processing: {e}")
+                continue
+            await self._ready.put(audio)
+
+    async def _play_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            audio = await self._ready.get()
+            if not self.voice_client.is_connected():
+                continue
+            # something else (e.g. !testaudio) may still be playing
+            while self.voice_client.is_playing():
+                await asyncio.sleep(0.1)
+
+            finished = asyncio.Event()
+
+            def after(error):
+                if error:
+                    print(f"TTS playback error: {error}")
+                loop.call_soon_threadsafe(finished.set)
+
+            try:
+                self.voice_client.play(OpusPacketSource(audio), after=after)
+            except Exception as e:
+                print(f"Error starting TTS playback: {e}")
+                continue
+            await finished.wait()
+
+    def close(self):
+        for task in self._tasks:
+            task.cancel()
+
+
+def get_player(voice_client):
+    """The TTSPlayer for a voice client, replacing one bound to an old connection"""
+    guild_id = voice_client.guild.id
+    player = players.get(guild_id)
+    if player is None or player.voice_client is not voice_client:
+        if player is not None:
+            player.close()
+        player = players[guild_id] = TTSPlayer(voice_client)
+    return player
+
+
+def close_player(guild_id):
+    player = players.pop(guild_id, None)
+    if player is not None:
+        player.close()